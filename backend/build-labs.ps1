@@ -17,6 +17,10 @@ $labs = @(
     @{Name="bank"; Tag="pentest/bank:latest"}
 )
 
+# Python labs import the shared labs/labkit package, so they are built
+# with labs/ as the context and their Dockerfile passed via -f
+$sharedContextLabs = @("crypto", "ssrf")
+
 $successful = 0
 $failed = 0
 $failedLabs = @()
@@ -33,10 +37,16 @@ foreach ($lab in $labs) {
         continue
     }
     
-    Push-Location $labPath
+    if ($sharedContextLabs -contains $lab.Name) {
+        Push-Location "labs"
+        $buildArgs = @("-f", "$($lab.Name)/Dockerfile", ".")
+    } else {
+        Push-Location $labPath
+        $buildArgs = @(".")
+    }
     
     try {
-        $result = docker build -t $lab.Tag . 2>&1
+        $result = docker build -t $lab.Tag @buildArgs 2>&1
         
         if ($LASTEXITCODE -eq 0) {
             Write-Host "  ✅ $($lab.Name) built successfully" -ForegroundColor Green
@@ -17,6 +17,10 @@ labs=(
     "bank:pentest/bank:latest"
 )
 
+# Python labs import the shared labs/labkit package, so they are built
+# with labs/ as the context and their Dockerfile passed via -f
+shared_context_labs=" crypto ssrf "
+
 successful=0
 failed=0
 failed_labs=()
@@ -35,9 +39,15 @@ for lab_entry in "${labs[@]}"; do
         continue
     fi
     
-    cd "$lab_path" || continue
+    if [[ "$shared_context_labs" == *" $lab_name "* ]]; then
+        build_args=(-f "$lab_name/Dockerfile" .)
+        cd labs || continue
+    else
+        build_args=(.)
+        cd "$lab_path" || continue
+    fi
     
-    if docker build -t "$tag" . > /dev/null 2>&1; then
+    if docker build -t "$tag" "${build_args[@]}" > /dev/null 2>&1; then
         echo "  ✅ $lab_name built successfully"
         ((successful++))
     else
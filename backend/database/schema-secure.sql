@@ -58,7 +58,7 @@ CREATE TABLE IF NOT EXISTS sandbox_instances (
     lab_type VARCHAR(100) NOT NULL, -- sql_injection, xss, ssrf, etc.
     difficulty_level VARCHAR(20) NOT NULL, -- easy, medium, hard, impossible
     port INT,
-    status VARCHAR(50) DEFAULT 'running', -- running, stopped, error
+    status VARCHAR(50) DEFAULT 'running', -- starting, running, stopped, error
     start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     auto_stop_time TIMESTAMP
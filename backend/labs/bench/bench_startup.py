@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark: how long a fresh lab process takes to become ready.
+
+For each lab it starts the server in a new interpreter, the way a
+container does (``python3 app.py`` with LAB_SERVER=dev or gunicorn), and
+polls ``/readyz`` until it answers 200. Separately it measures, also in
+fresh interpreters, how long ``import app`` and ``create_app()`` take.
+Each measurement is repeated --runs times and the median is reported.
+
+The run fails (exit code 1) when a lab's median time-to-ready exceeds its
+budget, so a heavy import creeping back onto the startup path is caught:
+
+    python3 bench/bench_startup.py                     # default budgets
+    python3 bench/bench_startup.py --budget-ms 800     # one budget for every lab
+    python3 bench/bench_startup.py --server gunicorn
+
+The SSRF lab is started with its internal file service and DNS responder
+running, as in its image, but on ephemeral ports (the image uses 8080 and
+udp/5353) so runs do not clash with each other or with a local lab.
+
+Usage: python3 bench/bench_startup.py [--runs N] [--server dev|gunicorn]
+                                      [--budget-ms MS] [--only LAB] [--output PATH]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_labs import LABS_DIR, RESULTS_DIR, git_revision
+
+LABS = ('crypto', 'ssrf')
+# Median spawn-to-ready budgets in milliseconds; generous for slow CI hosts
+DEFAULT_BUDGETS_MS = {'crypto': 1500, 'ssrf': 1500}
+READY_TIMEOUT = 30
+
+# Printed by a fresh interpreter: import and build times, and which heavy modules got loaded
+PHASES = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+built = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1e3,
+    'create_app_ms': (built - imported) * 1e3,
+    'heavy_modules': [m for m in ('numpy', 'requests') if m in sys.modules],
+}))
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def lab_env(lab, server, port, internal_dir):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': LABS_DIR,
+        'LAB_SERVER': server,
+        'LAB_HOST': '127.0.0.1',
+        'LAB_PORT': str(port),
+        'LAB_THREADS': '8',
+    })
+    if lab == 'ssrf':
+        env.update({
+            'SSRF_INTERNAL_DIR': internal_dir,
+            'SSRF_INTERNAL_BIND': '127.0.0.1',
+            'SSRF_INTERNAL_PORT': '0',
+            'SSRF_DNS_RESPONDER': '1',
+            'SSRF_DNS_PORT': '0',
+        })
+    return env
+
+
+def ready(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+    try:
+        conn.request('GET', '/readyz')
+        response = conn.getresponse()
+        return response.status == 200, response.read()
+    except (OSError, http.client.HTTPException):
+        return False, None
+    finally:
+        conn.close()
+
+
+def time_to_ready(lab, server, internal_dir):
+    """Milliseconds from spawning the lab to /readyz answering 200, and what it reported."""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=os.path.join(LABS_DIR, lab),
+                               env=lab_env(lab, server, port, internal_dir),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < READY_TIMEOUT:
+            ok, body = ready(port)
+            if ok:
+                return (time.perf_counter() - started) * 1e3, json.loads(body).get('startup_seconds')
+            if process.poll() is not None:
+                raise RuntimeError(f'{lab} exited with status {process.returncode} before it was ready')
+            time.sleep(0.005)
+        raise RuntimeError(f'{lab} was not ready after {READY_TIMEOUT}s')
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def phases(lab):
+    output = subprocess.run([sys.executable, '-c', PHASES], cwd=os.path.join(LABS_DIR, lab),
+                            env=dict(os.environ, PYTHONPATH=LABS_DIR),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per lab')
+    parser.add_argument('--server', choices=('dev', 'gunicorn'), default='dev')
+    parser.add_argument('--budget-ms', type=float, help='median time-to-ready budget for every lab')
+    parser.add_argument('--only', choices=LABS, help='benchmark a single lab')
+    parser.add_argument('--output', help='result file (default: bench/results/startup-<timestamp>-<rev>.json)')
+    args = parser.parse_args()
+
+    internal_dir = tempfile.mkdtemp(prefix='ssrf-internal-')
+    results = {}
+    over_budget = []
+    for lab in (args.only,) if args.only else LABS:
+        ready_ms, reported, import_ms, create_ms = [], [], [], []
+        heavy = []
+        for _ in range(args.runs):
+            measured = phases(lab)
+            import_ms.append(measured['import_ms'])
+            create_ms.append(measured['create_app_ms'])
+            heavy = measured['heavy_modules']
+            spawn_ms, startup_seconds = time_to_ready(lab, args.server, internal_dir)
+            ready_ms.append(spawn_ms)
+            if startup_seconds is not None:
+                reported.append(startup_seconds * 1e3)
+
+        budget = args.budget_ms or DEFAULT_BUDGETS_MS[lab]
+        result = results[lab] = {
+            'ready_p50_ms': statistics.median(ready_ms),
+            'ready_max_ms': max(ready_ms),
+            'reported_startup_p50_ms': statistics.median(reported) if reported else None,
+            'import_p50_ms': statistics.median(import_ms),
+            'create_app_p50_ms': statistics.median(create_ms),
+            'heavy_modules_at_startup': heavy,
+            'budget_ms': budget,
+        }
+        within = result['ready_p50_ms'] <= budget
+        if not within:
+            over_budget.append(lab)
+        print(f'  {lab:<8} ready p50 {result["ready_p50_ms"]:7.1f} ms (max {result["ready_max_ms"]:7.1f})  '
+              f'import {result["import_p50_ms"]:6.1f} ms  create_app {result["create_app_p50_ms"]:5.1f} ms  '
+              f'budget {budget:.0f} ms {"ok" if within else "EXCEEDED"}'
+              + (f'  eager: {", ".join(heavy)}' if heavy else ''))
+
+    revision = git_revision()
+    output = args.output or os.path.join(
+        RESULTS_DIR, 'startup-' + time.strftime('%Y%m%d-%H%M%S') + (f'-{revision}' if revision else '') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'revision': revision,
+            'timestamp': time.time(),
+            'python': sys.version.split()[0],
+            'server': args.server,
+            'runs': args.runs,
+            'results': results,
+        }, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if over_budget:
+        print(f'Startup budget exceeded: {", ".join(over_budget)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Zygote benchmark: spawn latency and memory sharing of forked lab instances.
+
+Starts labkit.zygote, asks it for --instances instances per lab and reports:
+
+  * spawn time: the control request until the instance's app is built,
+    and until its /readyz first answers 200;
+  * per-instance memory: RSS, and PSS (RSS with each shared page divided
+    among the processes sharing it) from /proc/<pid>/smaps_rollup;
+  * for SSRF, whether each instance's EASY and MEDIUM exploits
+    (localhost:8080 and 127.1:8080) return that instance's own flag, served
+    by the launcher's shared internal service. Ports 8080 and udp/5353 on
+    127.0.0.1 must be free.
+
+--baseline starts the same number of standalone ``python3 app.py``
+processes for comparison (the container way: nothing shared; each serves
+its internal files on an ephemeral port, as they cannot all bind 8080
+outside containers). Needs Linux. Exits 1 if an exploit fails.
+
+Usage: python3 bench/bench_zygote.py [--instances N] [--only LAB] [--baseline]
+                                     [--output PATH]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_labs import LABS_DIR, RESULTS_DIR, STAND_IN_FILES, git_revision
+from bench_startup import free_port, lab_env, ready
+from labkit import flags
+
+LABS = ('crypto', 'ssrf')
+FLAG_SECRET = 'bench-zygote'
+# The exploits as students send them: the internal service on its real port
+EXPLOITS = (('easy', 'http://localhost:8080/easy_flag.txt'), ('medium', 'http://127.1:8080/easy_flag.txt'))
+
+
+def memory(pid):
+    """RSS and PSS of ``pid`` in MB."""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss'):
+                values[name.lower()] = int(rest.split()[0]) / 1024
+    return values
+
+
+def wait_ready(port, timeout=30):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if ready(port)[0]:
+            return
+        time.sleep(0.002)
+    raise RuntimeError(f'instance on port {port} not ready after {timeout}s')
+
+
+class Control:
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.file = self.sock.makefile('rb')
+
+    def call(self, **request):
+        self.sock.sendall(json.dumps(request).encode() + b'\n')
+        reply = json.loads(self.file.readline())
+        if not reply.get('ok'):
+            raise RuntimeError(reply.get('error'))
+        return reply
+
+
+def exploits_work(port, user):
+    """Whether the SSRF exploits against the instance on ``port`` return its own flag."""
+    expected = flags.derive(STAND_IN_FILES['easy_flag.txt'].decode().strip(), FLAG_SECRET, str(user))
+    for level, url in EXPLOITS:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        try:
+            conn.request('POST', f'/api/fetch/{level}', json.dumps({'url': url}), {'Content-Type': 'application/json'})
+            content = json.loads(conn.getresponse().read()).get('content')
+        finally:
+            conn.close()
+        if content is None or content.strip() != expected:
+            return False
+    return True
+
+
+def start_zygote(labs, control_path, internal_dir):
+    env = dict(os.environ, PYTHONPATH=LABS_DIR, LAB_SERVER='dev', LAB_THREADS='8', LAB_FLAG_SECRET=FLAG_SECRET,
+               SSRF_INTERNAL_DIR=internal_dir, SSRF_INTERNAL_BIND='127.0.0.1', SSRF_DNS_RESPONDER='1')
+    process = subprocess.Popen([sys.executable, '-m', 'labkit.zygote', '--labs', ','.join(labs),
+                                '--control', control_path], cwd=LABS_DIR, env=env)
+    deadline = time.monotonic() + 60
+    while not os.path.exists(control_path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError('zygote did not start')
+        time.sleep(0.02)
+    return process
+
+
+def instance_env(lab, user):
+    # The SSRF internal service and DNS responder are the launcher's, on their default ports
+    return {'USER_ID': str(user), 'LAB_HOST': '127.0.0.1'}
+
+
+def bench_zygote(labs, count, internal_dir):
+    control_path = os.path.join(tempfile.mkdtemp(prefix='zygote-'), 'control.sock')
+    process = start_zygote(labs, control_path, internal_dir)
+    results = {}
+    try:
+        control = Control(control_path)
+        for lab in labs:
+            built, answered, pids, ports = [], [], [], []
+            for user in range(count):
+                started = time.perf_counter()
+                reply = control.call(op='spawn', lab=lab, port=0, env=instance_env(lab, user))
+                wait_ready(reply['port'])
+                answered.append((time.perf_counter() - started) * 1e3)
+                built.append(reply['ready_ms'])
+                pids.append(reply['pid'])
+                ports.append(reply['port'])
+            usage = [memory(pid) for pid in pids]
+            results[lab] = {
+                'instances': count,
+                'spawn_p50_ms': statistics.median(built),
+                'ready_p50_ms': statistics.median(answered),
+                'ready_max_ms': max(answered),
+                'rss_mb_per_instance': statistics.mean(u['rss'] for u in usage),
+                'pss_mb_per_instance': statistics.mean(u['pss'] for u in usage),
+            }
+            if lab == 'ssrf':
+                results[lab]['exploits_ok'] = all(exploits_work(port, user) for user, port in enumerate(ports))
+        results['zygote'] = memory(process.pid)
+    finally:
+        process.terminate()
+        process.wait(30)
+    return results
+
+
+def bench_baseline(labs, count, internal_dir):
+    results = {}
+    for lab in labs:
+        processes, answered = [], []
+        try:
+            for _ in range(count):
+                port = free_port()
+                env = lab_env(lab, 'dev', port, internal_dir)
+                started = time.perf_counter()
+                processes.append(subprocess.Popen([sys.executable, 'app.py'], cwd=os.path.join(LABS_DIR, lab),
+                                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+                wait_ready(port)
+                answered.append((time.perf_counter() - started) * 1e3)
+            usage = [memory(p.pid) for p in processes]
+            results[lab] = {
+                'instances': count,
+                'ready_p50_ms': statistics.median(answered),
+                'ready_max_ms': max(answered),
+                'rss_mb_per_instance': statistics.mean(u['rss'] for u in usage),
+                'pss_mb_per_instance': statistics.mean(u['pss'] for u in usage),
+            }
+        finally:
+            for p in processes:
+                p.terminate()
+            for p in processes:
+                p.wait(30)
+    return results
+
+
+def print_rows(name, results):
+    print(f'[{name}]')
+    for lab, r in results.items():
+        if lab == 'zygote':
+            print(f'  launcher  rss {r["rss"]:6.1f} MB  pss {r["pss"]:6.1f} MB')
+            continue
+        print(f'  {lab:<8}  {r["instances"]} instances  ready p50 {r["ready_p50_ms"]:7.1f} ms '
+              f'(max {r["ready_max_ms"]:7.1f})  rss {r["rss_mb_per_instance"]:6.1f} MB  '
+              f'pss {r["pss_mb_per_instance"]:6.1f} MB per instance'
+              + ('' if 'exploits_ok' not in r else f'  exploits {"ok" if r["exploits_ok"] else "FAILED"}'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--instances', type=int, default=10, help='instances per lab')
+    parser.add_argument('--only', choices=LABS, help='benchmark a single lab')
+    parser.add_argument('--baseline', action='store_true', help='also run standalone processes')
+    parser.add_argument('--output', help='result file (default: bench/results/zygote-<timestamp>-<rev>.json)')
+    args = parser.parse_args()
+
+    labs = (args.only,) if args.only else LABS
+    internal_dir = tempfile.mkdtemp(prefix='ssrf-internal-')
+    for name, content in STAND_IN_FILES.items():
+        with open(os.path.join(internal_dir, name), 'wb') as f:
+            f.write(content)
+    results = {'zygote': bench_zygote(labs, args.instances, internal_dir)}
+    print_rows('zygote', results['zygote'])
+    if args.baseline:
+        results['standalone'] = bench_baseline(labs, args.instances, internal_dir)
+        print_rows('standalone', results['standalone'])
+
+    revision = git_revision()
+    output = args.output or os.path.join(
+        RESULTS_DIR, 'zygote-' + time.strftime('%Y%m%d-%H%M%S') + (f'-{revision}' if revision else '') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'revision': revision,
+            'timestamp': time.time(),
+            'python': sys.version.split()[0],
+            'results': results,
+        }, f, indent=2)
+    print(f'\nResults written to {output}')
+    return 0 if results['zygote'].get('ssrf', {}).get('exploits_ok', True) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Replay captured lab traffic (LAB_CAPTURE, see labkit/capture.py) against a lab.
+
+Every captured client becomes a virtual client: a thread with its own
+keep-alive connection that sends that client's requests in order, at the
+captured pace divided by --speed (1 = real time, 10 = ten times faster,
+"max" = back to back). --clients N replays each session N times at once,
+to load a container with more students than were captured.
+
+A virtual client waits for each response before the next request, like a
+browser or script does, so a slow lab shows up as lag behind the captured
+schedule as well as latency. Against a loopback target each virtual client
+connects from its own 127.x.y.z address, so per-client state and rate
+limits see distinct students (--source-ips off to disable). Records whose
+body was cut at capture time are skipped.
+
+It reports throughput, latency and schedule lag overall and per route,
+status codes that differ from the capture, and writes a JSON result file
+like bench_labs.py.
+
+Usage: python3 bench/replay.py CAPTURE [CAPTURE ...] --url http://127.0.0.1:5000
+                               [--speed X|max] [--clients N] [--stagger S]
+                               [--only SUBSTRING] [--source-ips auto|off]
+                               [--output PATH] [--compare PATH]
+"""
+import argparse
+import base64
+import http.client
+import ipaddress
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from bench_labs import RESULTS_DIR, git_revision, peak_rss_mb, percentile
+
+FIRST_SOURCE_IP = ipaddress.IPv4Address('127.1.0.1')
+THREAD_STACK_SIZE = 256 * 1024
+
+
+def load_sessions(paths, only=None):
+    """Captured records grouped by (tenant, client), each in arrival order."""
+    sessions = defaultdict(list)
+    skipped = 0
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('cut') or (only and only not in (record.get('route') or record['p'])):
+                    skipped += 1
+                    continue
+                if 'b64' in record:
+                    record['data'] = base64.b64decode(record['b64'])
+                elif 'body' in record:
+                    record['data'] = record['body'].encode('utf-8')
+                else:
+                    record['data'] = None
+                sessions[(record.get('tenant'), record['c'])].append(record)
+    for records in sessions.values():
+        records.sort(key=lambda r: r['t'])
+    return list(sessions.values()), skipped
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+class VirtualClient(threading.Thread):
+    def __init__(self, target, records, start_offset, speed, source_ip):
+        super().__init__(daemon=True)
+        self.target = target
+        self.records = records
+        self.start_offset = start_offset
+        self.speed = speed
+        self.source_ip = source_ip
+        self.begin = None  # perf_counter() time of the captured timeline's start
+        self.samples = []  # (route, captured status, status, latency s, lag s, captured ms)
+        self._conn = None
+
+    def connection(self):
+        if self._conn is None:
+            host, port = self.target
+            source = (self.source_ip, 0) if self.source_ip else None
+            self._conn = http.client.HTTPConnection(host, port, timeout=60, source_address=source)
+        return self._conn
+
+    def send(self, record):
+        headers = {'Content-Type': record['type']} if record.get('type') else {}
+        try:
+            conn = self.connection()
+            conn.request(record['m'], record['p'], body=record['data'], headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            return 0
+
+    def run(self):
+        first = self.records[0]['t']
+        begin = self.begin
+        for record in self.records:
+            due = begin + self.start_offset + ((record['t'] - first) / self.speed if self.speed else 0)
+            now = time.perf_counter()
+            if now < due:
+                time.sleep(due - now)
+            sent = time.perf_counter()
+            status = self.send(record)
+            latency = time.perf_counter() - sent
+            self.samples.append((record.get('route') or record['p'].split('?', 1)[0], record['status'], status,
+                                 latency, max(0.0, sent - due), record['ms']))
+        if self._conn is not None:
+            self._conn.close()
+
+
+def summarize(samples, wall):
+    latencies = sorted(s[3] for s in samples)
+    lags = sorted(s[4] for s in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s[2] == 0 or s[2] >= 500),
+        'status_mismatches': sum(1 for s in samples if s[1] != s[2]),
+        'rps': len(samples) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1e3,
+        'captured_p50_ms': percentile(sorted(s[5] for s in samples), 0.50),
+        'lag_p50_ms': percentile(lags, 0.50) * 1e3,
+        'lag_p99_ms': percentile(lags, 0.99) * 1e3,
+    }
+
+
+def print_row(name, result):
+    print(f'  {name:<44} {result["requests"]:>7} req  {result["rps"]:>8,.0f} req/s  '
+          f'p50 {result["p50_ms"]:7.2f} ms (captured {result["captured_p50_ms"]:6.2f})  '
+          f'p99 {result["p99_ms"]:7.2f} ms  lag p99 {result["lag_p99_ms"]:7.1f} ms'
+          + (f'  errors {result["errors"]}' if result['errors'] else '')
+          + (f'  status changed {result["status_mismatches"]}' if result['status_mismatches'] else ''))
+
+
+def compare(previous_path, results):
+    with open(previous_path) as f:
+        previous = json.load(f)['results']
+    print(f'\nChange vs {previous_path}:')
+    for key, result in results.items():
+        old = previous.get(key)
+        if old and old.get('p50_ms') and old.get('p99_ms'):
+            print(f'  {key:<44} p50 {100 * (result["p50_ms"] / old["p50_ms"] - 1):+6.1f}%  '
+                  f'p99 {100 * (result["p99_ms"] / old["p99_ms"] - 1):+6.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('captures', nargs='+', help='NDJSON files written with LAB_CAPTURE')
+    parser.add_argument('--url', required=True, help='base URL of the lab to replay against')
+    parser.add_argument('--speed', default='1', help='pace multiplier, or "max" for no pauses (default: 1)')
+    parser.add_argument('--clients', type=int, default=1, help='virtual clients per captured session')
+    parser.add_argument('--stagger', type=float, default=0.0,
+                        help='seconds between the starts of copies of one session')
+    parser.add_argument('--only', help='replay only records whose route contains this substring')
+    parser.add_argument('--source-ips', choices=('auto', 'off'), default='auto',
+                        help='one 127.x.y.z source address per virtual client on loopback targets')
+    parser.add_argument('--output', help='result file (default: bench/results/replay-<timestamp>-<rev>.json)')
+    parser.add_argument('--compare', help='earlier replay result file to diff against')
+    args = parser.parse_args()
+
+    speed = 0.0 if args.speed == 'max' else float(args.speed)
+    if args.speed != 'max' and speed <= 0:
+        parser.error('--speed must be positive or "max"')
+    parts = urlsplit(args.url)
+    target = (parts.hostname, parts.port or 80)
+
+    sessions, skipped = load_sessions(args.captures, args.only)
+    if not sessions:
+        print('Nothing to replay')
+        return 1
+    spread = args.source_ips == 'auto' and sys.platform.startswith('linux') and is_loopback(target[0])
+
+    threading.stack_size(THREAD_STACK_SIZE)
+    first = min(records[0]['t'] for records in sessions)
+    clients = []
+    for copy in range(args.clients):
+        for records in sessions:
+            # Sessions keep their place in the captured timeline
+            offset = copy * args.stagger + ((records[0]['t'] - first) / speed if speed else 0)
+            source_ip = str(FIRST_SOURCE_IP + len(clients)) if spread else None
+            clients.append(VirtualClient(target, records, offset, speed, source_ip))
+
+    total = sum(len(c.records) for c in clients)
+    print(f'Replaying {total} requests from {len(sessions)} sessions as {len(clients)} virtual clients '
+          f'against {args.url} at {"max" if not speed else f"{speed:g}x"} speed'
+          + (f' ({skipped} records skipped)' if skipped else ''))
+
+    begin = time.perf_counter() + 0.5  # let every thread start before the first request is due
+    for client in clients:
+        client.begin = begin
+        client.start()
+    for client in clients:
+        client.join()
+    wall = time.perf_counter() - begin
+
+    samples = [sample for client in clients for sample in client.samples]
+    by_route = defaultdict(list)
+    for sample in samples:
+        by_route[sample[0]].append(sample)
+
+    results = {'all': summarize(samples, wall)}
+    print_row('all', results['all'])
+    for route in sorted(by_route):
+        results[route] = summarize(by_route[route], wall)
+        print_row(route, results[route])
+    print(f'  wall {wall:.2f} s, peak rss {peak_rss_mb():.1f} MB')
+
+    revision = git_revision()
+    output = args.output or os.path.join(
+        RESULTS_DIR, 'replay-' + time.strftime('%Y%m%d-%H%M%S') + (f'-{revision}' if revision else '') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'revision': revision,
+            'timestamp': time.time(),
+            'python': sys.version.split()[0],
+            'url': args.url,
+            'captures': args.captures,
+            'speed': args.speed,
+            'clients_per_session': args.clients,
+            'sessions': len(sessions),
+            'skipped_records': skipped,
+            'wall_seconds': wall,
+            'results': results,
+        }, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        compare(args.compare, results)
+
+    return 1 if results['all']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
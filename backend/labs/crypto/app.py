@@ -1,19 +1,35 @@
-from flask import Flask, request, render_template_string, jsonify
+from flask import Blueprint, Flask, current_app, Response, request, render_template_string, jsonify, stream_with_context
 import base64
 import hashlib
 import hmac
+import itertools
+import json
 from Crypto.Cipher import AES, DES
 from Crypto.Util.Padding import pad, unpad
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
 import os
 import time
 
-app = Flask(__name__)
+from labkit import admission, capture, events, flags, health, metrics, serving
+from labkit.pages import PrecompressedPage
+
+bp = Blueprint('crypto', __name__)
 
 # Weak encryption keys
 WEAK_KEY = b'1234567890123456'  # 16 bytes for AES
 DES_KEY = b'weakkey8'  # 8 bytes for DES
 HMAC_SECRET = b'secret'
 
+# Base flags (lab_configurations.flags); each instance serves its own variant, see labkit.flags
+FLAGS = {
+    'easy': 'FLAG{b4s3_64_3nc0d1ng}',
+    'medium': 'FLAG{w34k_c1ph3r_cr4ck3d}',
+    'hard': 'FLAG{h4sh_c0ll1s10n_f0und}',
+    'impossible': 'FLAG{qu4ntum_r3s1st4nt_br0k3n}',
+}
+VERIFIABLE_LEVELS = ('medium', 'hard', 'impossible')
+
 HOME_PAGE = '''
 <!DOCTYPE html>
 <html>
@@ -44,7 +60,7 @@ HOME_PAGE = '''
             
             <div>
                 <strong>Encrypted Message:</strong><br>
-                <code id="easy-encrypted">RkxBR3tiNHMzXzY0XzNuYzBkMW5nfQ==</code>
+                <code id="easy-encrypted">{{ easy_encoded }}</code>
             </div>
             
             <br>
@@ -80,6 +96,10 @@ HOME_PAGE = '''
             
             <div id="hard-result" class="result" style="display:none;"></div>
             <div class="hint">Hint: Find MD5 collision pairs online or use known collision prefixes.</div>
+            <p>Birthday mode: only a prefix of the MD5 has to match. Stream as many candidates as you like
+            (one per line, text/plain) to <code>POST api/crypto/collision/birthday</code>; the server remembers
+            everything you sent and reports the first two that collide. This is practice for the
+            birthday bound and does not award the flag.</p>
         </div>
         
         <div class="level">
@@ -114,7 +134,7 @@ HOME_PAGE = '''
         }
         
         async function getEncrypted() {
-            const res = await fetch('/api/crypto/medium');
+            const res = await fetch('api/crypto/medium');
             const data = await res.json();
             
             document.getElementById('med-encrypted').style.display = 'block';
@@ -127,7 +147,7 @@ HOME_PAGE = '''
         async function submitMedium() {
             const flag = document.getElementById('med-decrypt').value;
             
-            const res = await fetch('/api/crypto/verify', {
+            const res = await fetch('api/crypto/verify', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ flag, level: 'medium' })
@@ -142,7 +162,7 @@ HOME_PAGE = '''
             const input1 = document.getElementById('hard-input1').value;
             const input2 = document.getElementById('hard-input2').value;
             
-            const res = await fetch('/api/crypto/collision', {
+            const res = await fetch('api/crypto/collision', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ input1, input2 })
@@ -160,7 +180,7 @@ HOME_PAGE = '''
         async function getPaddingOracle() {
             const ciphertext = document.getElementById('imp-ciphertext').value;
             
-            const res = await fetch('/api/crypto/padding-oracle', {
+            const res = await fetch('api/crypto/padding-oracle', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ ciphertext })
@@ -176,7 +196,7 @@ HOME_PAGE = '''
         
         // Load impossible challenge on page load
         window.onload = async function() {
-            const res = await fetch('/api/crypto/impossible');
+            const res = await fetch('api/crypto/impossible');
             const data = await res.json();
             document.getElementById('imp-token').textContent = data.token;
             document.getElementById('imp-ciphertext').value = data.token;
@@ -186,57 +206,61 @@ HOME_PAGE = '''
 </html>
 '''
 
-# EASY: Base64 encoding (already in page)
-@app.route('/api/crypto/easy')
+# EASY: Base64 encoding (also shown on the page)
+@bp.route('/api/crypto/easy')
 def crypto_easy():
-    flag = "FLAG{b4s3_64_3nc0d1ng}"
-    encoded = base64.b64encode(flag.encode()).decode()
     return jsonify({
-        'encoded': encoded,
+        'encoded': current_app.extensions['artifacts']['easy'],
         'hint': 'This is just Base64 encoding, not encryption!'
     })
 
 # MEDIUM: Weak DES encryption
-@app.route('/api/crypto/medium')
+@bp.route('/api/crypto/medium')
 def crypto_medium():
-    flag = "FLAG{w34k_c1ph3r_cr4ck3d}"
-    
-    # DES encryption with weak key
-    cipher = DES.new(DES_KEY, DES.MODE_ECB)
-    encrypted = cipher.encrypt(pad(flag.encode(), DES.block_size))
-    
+    # DES-ECB with a weak key is deterministic: encrypted once per instance
     return jsonify({
-        'encrypted': encrypted.hex(),
+        'encrypted': current_app.extensions['artifacts']['medium'],
         'algorithm': 'DES-ECB',
         'hint': 'Key is "weakkey8" (8 bytes)'
     })
 
 # Verify decrypted flag
-@app.route('/api/crypto/verify', methods=['POST'])
+@bp.route('/api/crypto/verify', methods=['POST'])
 def verify_flag():
     data = request.json
     flag = data.get('flag', '')
     level = data.get('level', 'medium')
     
-    correct_flags = {
-        'medium': 'FLAG{w34k_c1ph3r_cr4ck3d}',
-        'hard': 'FLAG{h4sh_c0ll1s10n_f0und}',
-        'impossible': 'FLAG{qu4ntum_r3s1st4nt_br0k3n}'
-    }
-    
-    if flag == correct_flags.get(level):
+    if level in VERIFIABLE_LEVELS and current_app.extensions['flags'].verify(level, flag):
+        events.emit(level, 'correct')
         return jsonify({
             'success': True,
             'message': f'✅ Correct! {flag}'
         })
     else:
+        events.emit(level if level in VERIFIABLE_LEVELS else 'unknown', 'incorrect')
         return jsonify({
             'success': False,
             'message': '❌ Incorrect flag'
         })
 
 # HARD: Hash collision
-@app.route('/api/crypto/collision', methods=['POST'])
+def collision_response(hash1, hash2, same_input):
+    collision = (hash1 == hash2 and not same_input)
+    
+    response = {
+        'hash1': hash1,
+        'hash2': hash2,
+        'collision': collision
+    }
+    
+    if collision:
+        response['flag'] = current_app.extensions['flags']['hard']
+    
+    events.emit('hard', 'collision' if collision else 'miss')
+    return response
+
+@bp.route('/api/crypto/collision', methods=['POST'])
 def check_collision():
     data = request.json
     input1 = data.get('input1', '').encode()
@@ -245,28 +269,183 @@ def check_collision():
     hash1 = hashlib.md5(input1).hexdigest()
     hash2 = hashlib.md5(input2).hexdigest()
     
-    collision = (hash1 == hash2 and input1 != input2)
+    return jsonify(collision_response(hash1, hash2, input1 == input2))
+
+# HARD (binary upload): hash collision pairs straight off the request stream
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('COLLISION_MAX_UPLOAD_BYTES', 4 * 1024 * 1024))
+
+def _upload_chunks(limit=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Request body in fixed-size chunks, refusing to read past ``limit`` bytes."""
+    if (request.content_length or 0) > limit:
+        raise RequestEntityTooLarge()
     
-    response = {
-        'hash1': hash1,
-        'hash2': hash2,
-        'collision': collision
+    total = 0
+    while True:
+        chunk = request.stream.read(chunk_size)
+        if not chunk:
+            return
+        
+        total += len(chunk)
+        if total > limit:
+            raise RequestEntityTooLarge()
+        
+        yield chunk
+
+def _hash_multipart(hashers):
+    """Feed the input1/input2 parts of a multipart body into their hashers."""
+    boundary = request.mimetype_params.get('boundary', '').encode()
+    if not boundary:
+        raise ValueError('Missing multipart boundary')
+    
+    decoder = MultipartDecoder(boundary)
+    current = None
+    
+    # A trailing None tells the decoder the body has ended
+    for chunk in itertools.chain(_upload_chunks(), [None]):
+        decoder.receive_data(chunk)
+        event = decoder.next_event()
+        while not isinstance(event, (Epilogue, NeedData)):
+            if isinstance(event, (Field, File)):
+                current = hashers.get(event.name)
+            elif isinstance(event, Data) and current is not None:
+                for h in current:
+                    h.update(event.data)
+            event = decoder.next_event()
+        
+        if isinstance(event, Epilogue):
+            return
+    
+    raise ValueError('Truncated multipart body')
+
+def _hash_split(hashers, split):
+    """Feed the first ``split`` body bytes to input1 and the rest to input2."""
+    remaining = split
+    for chunk in _upload_chunks():
+        head = chunk[:remaining]
+        for h in hashers['input1']:
+            h.update(head)
+        for h in hashers['input2']:
+            h.update(chunk[len(head):])
+        remaining -= len(head)
+
+@bp.route('/api/crypto/collision/upload', methods=['POST'])
+def check_collision_upload():
+    # MD5 for the challenge, SHA-256 to tell identical inputs apart without keeping them
+    hashers = {
+        'input1': (hashlib.md5(), hashlib.sha256()),
+        'input2': (hashlib.md5(), hashlib.sha256()),
     }
     
-    if collision:
-        response['flag'] = 'FLAG{h4sh_c0ll1s10n_f0und}'
+    try:
+        if request.mimetype == 'multipart/form-data':
+            _hash_multipart(hashers)
+        elif request.mimetype == 'application/octet-stream':
+            split = request.args.get('split', type=int)
+            if split is None or split < 0:
+                return jsonify({'error': 'Query parameter "split" (length of input1) is required'}), 400
+            _hash_split(hashers, split)
+        else:
+            return jsonify({'error': 'Send multipart/form-data (input1, input2) or application/octet-stream with ?split=N'}), 415
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'Upload larger than {MAX_UPLOAD_BYTES} bytes'}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    md5_1, sha_1 = hashers['input1']
+    md5_2, sha_2 = hashers['input2']
+    
+    return jsonify(collision_response(md5_1.hexdigest(), md5_2.hexdigest(), sha_1.digest() == sha_2.digest()))
+
+# HARD (birthday mode): stream many candidates; any two whose truncated MD5s
+# match collide. Indexed per client by birthday.py.
+BIRTHDAY_MAX_UPLOAD_BYTES = int(os.environ.get('COLLISION_BIRTHDAY_MAX_UPLOAD_BYTES', 64 * 1024 * 1024))
+BIRTHDAY_CHUNK_SIZE = 1024 * 1024
+MAX_BIRTHDAY_LINE = 4096
+
+def _fixed_size_candidates(size):
+    """Batches of ``size``-byte candidates from a raw body, one per chunk read."""
+    pending = b''
+    for chunk in _upload_chunks(BIRTHDAY_MAX_UPLOAD_BYTES, BIRTHDAY_CHUNK_SIZE):
+        data = pending + chunk if pending else chunk
+        usable = len(data) - len(data) % size
+        view = memoryview(data)
+        yield [view[i:i + size] for i in range(0, usable, size)]
+        pending = data[usable:]
+    
+    if pending:
+        raise ValueError('Body length is not a multiple of size')
+
+def _line_candidates():
+    """Batches of newline-separated candidates, one per chunk read."""
+    pending = b''
+    for chunk in _upload_chunks(BIRTHDAY_MAX_UPLOAD_BYTES, BIRTHDAY_CHUNK_SIZE):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        if len(pending) > MAX_BIRTHDAY_LINE:
+            raise ValueError(f'Line longer than {MAX_BIRTHDAY_LINE} bytes')
+        yield lines
     
+    if pending:
+        yield [pending]
+
+def birthday_response(index):
+    # Report only: a truncated collision is a birthday exercise, not the HARD level's MD5 collision
+    response = index.state()
+    response['collision'] = index.collision
+    return response
+
+@bp.route('/api/crypto/collision/birthday', methods=['GET', 'POST', 'DELETE'])
+def collision_birthday():
+    # Imported here like padding_engine: the index is NumPy-backed
+    import birthday
+    
+    # One pool for the whole process, so tenants share its memory bound
+    client = (current_app.config.get('TENANT_ID'), request.remote_addr)
+    if request.method == 'DELETE':
+        return jsonify({'reset': birthday.SESSIONS.reset(client)})
+    
+    index = birthday.SESSIONS.get(client)
+    if request.method == 'GET':
+        return jsonify(birthday_response(index))
+    
+    if request.mimetype == 'application/octet-stream':
+        size = request.args.get('size', type=int)
+        if not size or size < 1 or size > MAX_BIRTHDAY_LINE:
+            return jsonify({'error': f'Query parameter "size" (1-{MAX_BIRTHDAY_LINE} bytes per candidate) is required'}), 400
+        batches = _fixed_size_candidates(size)
+    elif request.mimetype == 'text/plain':
+        batches = _line_candidates()
+    else:
+        return jsonify({'error': 'Send application/octet-stream with ?size=N or text/plain, one candidate per line'}), 415
+    
+    # One upload at a time per client, so candidate numbers follow the stream
+    accepted = 0
+    with index.lock:
+        try:
+            for batch in batches:
+                taken = index.add(batch)
+                accepted += taken
+                if taken < len(batch):
+                    break
+        except RequestEntityTooLarge:
+            return jsonify({'error': f'Upload larger than {BIRTHDAY_MAX_UPLOAD_BYTES} bytes'}), 413
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = birthday_response(index)
+    
+    response['accepted'] = accepted
+    events.emit('hard', 'truncated-collision' if index.collision is not None else 'miss', count=accepted)
     return jsonify(response)
 
 # IMPOSSIBLE: Padding oracle
-@app.route('/api/crypto/impossible')
+@bp.route('/api/crypto/impossible')
 def crypto_impossible():
-    flag = "FLAG{qu4ntum_r3s1st4nt_br0k3n}"
-    
-    # AES-CBC encryption
+    # AES-CBC encryption of the padded flag, under a fresh IV per token
     iv = os.urandom(16)
     cipher = AES.new(WEAK_KEY, AES.MODE_CBC, iv)
-    encrypted = cipher.encrypt(pad(flag.encode(), AES.block_size))
+    encrypted = cipher.encrypt(current_app.extensions['artifacts']['impossible'])
     
     # Return IV + ciphertext
     token = (iv + encrypted).hex()
@@ -276,16 +455,11 @@ def crypto_impossible():
         'hint': 'AES-CBC with padding oracle vulnerability'
     })
 
-@app.route('/api/crypto/padding-oracle', methods=['POST'])
-def padding_oracle():
-    data = request.json
-    ciphertext_hex = data.get('ciphertext', '')
-    
+def check_padding(ciphertext):
+    """Padding oracle verdict for raw IV + ciphertext bytes."""
     try:
-        ciphertext = bytes.fromhex(ciphertext_hex)
-        
         if len(ciphertext) < 32:
-            return jsonify({'valid': False, 'error': 'Ciphertext too short'})
+            return {'valid': False, 'error': 'Ciphertext too short'}
         
         iv = ciphertext[:16]
         encrypted = ciphertext[16:]
@@ -297,21 +471,244 @@ def padding_oracle():
             
             # If padding is valid and decrypts to flag, return it
             if b'FLAG{' in decrypted:
-                return jsonify({
+                return {
                     'valid': True,
                     'flag': decrypted.decode()
-                })
+                }
             
-            return jsonify({'valid': True})
+            return {'valid': True}
         except ValueError:
             # Padding error
-            return jsonify({'valid': False, 'error': 'Padding invalid'})
+            return {'valid': False, 'error': 'Padding invalid'}
     except Exception as e:
-        return jsonify({'valid': False, 'error': str(e)})
+        return {'valid': False, 'error': str(e)}
+
+def oracle_outcome(result):
+    if 'flag' in result:
+        return 'flag'
+    return 'valid' if result['valid'] else 'invalid'
+
+def check_padding_hex(ciphertext_hex):
+    """Padding oracle verdict for a hex-encoded IV + ciphertext."""
+    try:
+        ciphertext = bytes.fromhex(ciphertext_hex)
+    except Exception as e:
+        return {'valid': False, 'error': str(e)}
+    
+    return check_padding(ciphertext)
+
+@bp.route('/api/crypto/padding-oracle', methods=['POST'])
+def padding_oracle():
+    data = request.json
+    ciphertext_hex = data.get('ciphertext', '')
+    
+    metrics.count_oracle_queries('single')
+    result = check_padding_hex(ciphertext_hex)
+    events.emit('impossible', oracle_outcome(result))
+    return jsonify(result)
+
+# Batch oracle: one request, many candidates, one validity bit per candidate
+MAX_BATCH_CANDIDATES = 4096
+# IV + ciphertext; the IMPOSSIBLE token is 48 bytes
+MAX_CIPHERTEXT_BYTES = 1024
+
+@bp.route('/api/crypto/padding-oracle/batch', methods=['POST'])
+def padding_oracle_batch():
+    if request.mimetype == 'application/octet-stream':
+        # Raw body: candidates of ?size=N bytes each, back to back
+        size = request.args.get('size', type=int)
+        if not size or size < 1 or size > MAX_CIPHERTEXT_BYTES:
+            return jsonify({'error': f'Query parameter "size" (1-{MAX_CIPHERTEXT_BYTES} bytes per ciphertext) is required'}), 400
+        
+        # Read in chunks so a chunked body (no Content-Length) is capped too
+        try:
+            body = b''.join(_upload_chunks(size * MAX_BATCH_CANDIDATES))
+        except RequestEntityTooLarge:
+            return jsonify({'error': f'At most {MAX_BATCH_CANDIDATES} ciphertexts per batch'}), 413
+        
+        if len(body) % size:
+            return jsonify({'error': 'Body length is not a multiple of size'}), 400
+        
+        candidates = [body[i:i + size] for i in range(0, len(body), size)]
+        if len(candidates) > MAX_BATCH_CANDIDATES:
+            return jsonify({'error': f'At most {MAX_BATCH_CANDIDATES} ciphertexts per batch'}), 413
+    else:
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Send a JSON object {"ciphertexts": [...]}'}), 400
+        
+        ciphertexts = data.get('ciphertexts', [])
+        if not isinstance(ciphertexts, list):
+            return jsonify({'error': '"ciphertexts" must be a list of hex strings'}), 400
+        
+        if len(ciphertexts) > MAX_BATCH_CANDIDATES:
+            return jsonify({'error': f'At most {MAX_BATCH_CANDIDATES} ciphertexts per batch'}), 413
+        
+        # Undecodable entries become empty messages, which are never valid
+        candidates = []
+        for ciphertext_hex in ciphertexts:
+            try:
+                candidates.append(bytes.fromhex(ciphertext_hex))
+            except Exception:
+                candidates.append(b'')
+    
+    rejected = admission.charge(len(candidates))
+    if rejected is not None:
+        return rejected
+    
+    metrics.count_oracle_queries('batch', len(candidates))
+    
+    # Bit i (MSB first) of the bitmap is the verdict for candidate i
+    bitmap = bytearray((len(candidates) + 7) // 8)
+    response = {'count': len(candidates)}
+    
+    # The vectorized engine answers every candidate from the target block's
+    # cached decryption; the few with valid padding go through the full
+    # single-shot check so flag reveal and edge cases match exactly.
+    # Imported here: NumPy is a third of the startup time and only batches need it.
+    import padding_engine
+    
+    for i in padding_engine.check_ciphertexts(WEAK_KEY, candidates).nonzero()[0]:
+        result = check_padding(candidates[i])
+        if result['valid']:
+            bitmap[i >> 3] |= 0x80 >> (i & 7)
+            if 'flag' in result and 'flag' not in response:
+                response['flag'] = result['flag']
+    
+    response['bitmap'] = bitmap.hex()
+    events.emit('impossible', 'flag' if 'flag' in response else 'valid' if any(bitmap) else 'invalid',
+                count=len(candidates))
+    return jsonify(response)
+
+# Streaming oracle: one long-lived request, one NDJSON verdict line per query
+MAX_STREAM_LINE = 64 * 1024
+STREAM_IDLE_SECONDS = float(os.environ.get('ORACLE_STREAM_IDLE_SECONDS', 15))
+STREAM_SESSION_SECONDS = float(os.environ.get('ORACLE_STREAM_SESSION_SECONDS', 300))
+# Every open session holds a server thread: at most half of them, one per client by default
+STREAMS = admission.Concurrency(
+    'padding-oracle-stream',
+    int(os.environ.get('ORACLE_STREAM_MAX', max(1, int(os.environ.get('LAB_THREADS', 8)) // 2))),
+    int(os.environ.get('ORACLE_STREAM_MAX_PER_CLIENT', 1)),
+)
+
+def _stream_query(line):
+    """Ciphertext hex from one NDJSON line: {"ciphertext": ...}, a JSON string, or bare hex."""
+    if line[:1] in (b'{', b'"'):
+        query = json.loads(line)
+        return query.get('ciphertext', '') if isinstance(query, dict) else query
+    return line.decode('ascii', 'replace')
+
+def _connection_socket():
+    """The client connection under gunicorn or the Werkzeug server, to put timeouts on."""
+    return request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+
+@bp.route('/api/crypto/padding-oracle/stream', methods=['POST'])
+def padding_oracle_stream():
+    client = (current_app.config.get('TENANT_ID'), request.remote_addr)
+    refused = STREAMS.acquire(client)
+    if refused == 'client':
+        return jsonify({'error': f'At most {STREAMS.per_client} open stream(s) per client'}), 429
+    if refused == 'full':
+        return jsonify({'error': 'Too many open streams, use the batch oracle or retry later'}), 503
+    
+    stream = request.stream
+    sock = _connection_socket()
+    deadline = time.monotonic() + STREAM_SESSION_SECONDS
+    
+    def generate():
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield json.dumps({'valid': False, 'error': f'Session longer than {STREAM_SESSION_SECONDS:g}s, reconnect'}) + '\n'
+                break
+            
+            # Bounds the wait for the next query (and for the client to read our replies)
+            if sock is not None:
+                sock.settimeout(min(STREAM_IDLE_SECONDS, remaining))
+            try:
+                line = stream.readline(MAX_STREAM_LINE + 1)
+            except TimeoutError:
+                yield json.dumps({'valid': False, 'error': f'No query for {STREAM_IDLE_SECONDS:g}s, closing'}) + '\n'
+                break
+            if not line:
+                break
+            
+            if len(line) > MAX_STREAM_LINE:
+                yield json.dumps({'valid': False, 'error': f'Line longer than {MAX_STREAM_LINE} bytes'}) + '\n'
+                break
+            
+            line = line.strip()
+            if not line:
+                continue
+            
+            wait = admission.retry_after()
+            if wait:
+                # The stream ends here; reconnect after retry_after seconds
+                yield json.dumps({'valid': False, 'error': 'Too many requests, slow down',
+                                  'retry_after': round(wait, 3)}) + '\n'
+                break
+            
+            metrics.count_oracle_queries('stream')
+            started = time.perf_counter()
+            try:
+                result = check_padding_hex(_stream_query(line))
+            except ValueError:
+                result = {'valid': False, 'error': 'Invalid JSON'}
+            
+            events.emit('impossible', oracle_outcome(result), elapsed=time.perf_counter() - started)
+            yield json.dumps(result) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # The server closes the response even if the generator never ran
+    response.call_on_close(lambda: STREAMS.release(client))
+    return response
 
-@app.route('/')
+@bp.route('/')
 def home():
-    return render_template_string(HOME_PAGE)
+    return current_app.extensions['home_page'].response()
+
+# Brute-force endpoints: per-client token buckets (requests, or candidates, per second)
+RATE_LIMITS = {
+    'crypto.padding_oracle': admission.Rule('padding-oracle', rate=1000, burst=4096),
+    'crypto.padding_oracle_batch': admission.Rule('padding-oracle', rate=1000, burst=4096, per_request=False),
+    'crypto.padding_oracle_stream': admission.Rule('padding-oracle', rate=1000, burst=4096, per_request=False),
+    'crypto.check_collision': admission.Rule('collision', rate=20, burst=40),
+    'crypto.check_collision_upload': admission.Rule('collision', rate=20, burst=40),
+    'crypto.collision_birthday': admission.Rule('collision', rate=20, burst=40),
+    'crypto.verify_flag': admission.Rule('verify', rate=5, burst=20),
+}
+
+def build_artifacts(flag_set):
+    """What the levels hand out, derived from the instance's flags once."""
+    return {
+        'easy': base64.b64encode(flag_set['easy'].encode()).decode(),
+        'medium': DES.new(DES_KEY, DES.MODE_ECB).encrypt(pad(flag_set['medium'].encode(), DES.block_size)).hex(),
+        'impossible': pad(flag_set['impossible'].encode(), AES.block_size),
+    }
+
+def create_app(config=None):
+    """Build the Cryptographic Failures lab application.
+    
+    ``config`` overrides app.config; the multi-tenant host passes TENANT_ID.
+    """
+    app = Flask(__name__)
+    app.config.update(config or {})
+    app.register_blueprint(bp)
+    metrics.init_app(app)
+    health.init_app(app)
+    capture.init_app(app)
+    events.init_app(app)
+    admission.init_app(app, RATE_LIMITS)
+    app.extensions['artifacts'] = build_artifacts(flags.init_app(app, FLAGS))
+    
+    # The home page never changes: render it per app (it shows the instance's EASY
+    # flag), compress each distinct page once per process
+    with app.app_context():
+        app.extensions['home_page'] = PrecompressedPage.shared(
+            render_template_string(HOME_PAGE, easy_encoded=app.extensions['artifacts']['easy']).encode())
+    
+    health.mark_ready(app)
+    return app
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=80, debug=False)
+    serving.run(create_app)
@@ -0,0 +1,227 @@
+"""Birthday-attack mode for the hash collision (HARD) level.
+
+Students stream candidates in large batches. Every candidate's MD5 is cut
+to its first COLLISION_BIRTHDAY_BITS bits and looked up in an index of all
+candidates the same client submitted before. The first pair of different
+candidates with the same truncated digest is a collision. It is kept and
+reported from then on, until the client resets its index.
+
+The index is an open-addressing hash table (linear probing) held in two
+NumPy arrays, 12 bytes per slot:
+
+  * a uint64 key that packs (prefix + 1) with the next 63 - bits bits of
+    the digest. The extra bits tell a resubmitted candidate apart from a
+    new one with the same prefix; 0 marks an empty slot.
+  * the uint32 number of the candidate that filled the slot.
+
+Lookups and inserts run for a whole batch at once. The table starts small
+and doubles at half load. It stops growing at COLLISION_BIRTHDAY_MAX_ENTRIES
+candidates; after that the client has to reset. Candidates whose full
+digests are identical count as one: a full MD5 collision is the regular
+HARD check's business.
+
+The indexes live in one process-wide pool, SESSIONS, keyed by whatever the
+caller passes (the app uses tenant and client address), so the memory bound
+holds however many tenant apps the process serves.
+
+With b bits a collision is expected after about 1.25 * 2**(b/2)
+candidates (~330k for the default 36).
+
+    COLLISION_BIRTHDAY_BITS         digest bits compared            (default: 36)
+    COLLISION_BIRTHDAY_MAX_ENTRIES  candidates indexed per client   (default: 1048576)
+    COLLISION_BIRTHDAY_SESSIONS     clients indexed per process     (default: 8)
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from labkit import metrics
+
+BITS = int(os.environ.get('COLLISION_BIRTHDAY_BITS', 36))
+MAX_ENTRIES = int(os.environ.get('COLLISION_BIRTHDAY_MAX_ENTRIES', 1 << 20))
+MAX_SESSIONS = int(os.environ.get('COLLISION_BIRTHDAY_SESSIONS', 8))
+MIN_BITS, MAX_BITS = 16, 48
+INITIAL_SLOTS = 1 << 16
+
+CANDIDATES = metrics.REGISTRY.counter(
+    'lab_collision_birthday_candidates_total', 'Candidates indexed by the birthday-mode collision level.')
+
+
+def digest_words(candidates):
+    """First 8 bytes of each candidate's MD5, as a big-endian uint64 array."""
+    md5 = hashlib.md5
+    digests = b''.join([md5(candidate).digest() for candidate in candidates])
+    return np.frombuffer(digests, dtype='>u8')[::2].astype(np.uint64)
+
+
+class Index:
+    """Truncated-digest index of one client's candidates."""
+
+    def __init__(self, bits=BITS, max_entries=MAX_ENTRIES):
+        if not MIN_BITS <= bits <= MAX_BITS:
+            raise ValueError(f'bits must be between {MIN_BITS} and {MAX_BITS}')
+        self.bits = bits
+        self.max_entries = min(max_entries, 2 ** 32 - 1)
+        self.count = 0  # candidates accepted, i.e. the next candidate's number
+        self.entries = 0  # distinct keys stored
+        self.collision = None
+        self.lock = threading.Lock()
+        self._shift = np.uint64(63 - bits)
+        self._prefix_shift = np.uint64(64 - bits)
+        self._tag_mask = np.uint64((1 << (63 - bits)) - 1)
+        self._allocate(INITIAL_SLOTS)
+
+    def _allocate(self, slots):
+        self._keys = np.zeros(slots, dtype=np.uint64)
+        self._numbers = np.zeros(slots, dtype=np.uint32)
+        self._mask = np.uint64(slots - 1)
+
+    @property
+    def nbytes(self):
+        return self._keys.nbytes + self._numbers.nbytes
+
+    def _find(self, keys):
+        """Slot holding each key's prefix, or the empty slot its probe ends at."""
+        prefixes = keys >> self._shift
+        slots = prefixes & self._mask
+        found = np.empty(len(keys), dtype=np.uint64)
+        pending = np.arange(len(keys))
+        while pending.size:
+            probe = slots[pending]
+            stored = self._keys[probe]
+            done = (stored == 0) | ((stored >> self._shift) == prefixes[pending])
+            found[pending[done]] = probe[done]
+            pending = pending[~done]
+            slots[pending] = (slots[pending] + np.uint64(1)) & self._mask
+        return found
+
+    def _insert(self, keys, numbers):
+        # New keys only (no prefix already stored); several may end at the same
+        # empty slot, so each round the first one per slot takes it
+        while keys.size:
+            slots = self._find(keys)
+            _, won = np.unique(slots, return_index=True)
+            self._keys[slots[won]] = keys[won]
+            self._numbers[slots[won]] = numbers[won]
+            lost = np.ones(len(keys), dtype=bool)
+            lost[won] = False
+            keys, numbers = keys[lost], numbers[lost]
+
+    def _grow(self, entries):
+        slots = len(self._keys)
+        while entries * 2 > slots:
+            slots *= 2
+        if slots == len(self._keys):
+            return
+        used = self._keys != 0
+        keys, numbers = self._keys[used], self._numbers[used]
+        self._allocate(slots)
+        self._insert(keys, numbers)
+
+    def add(self, candidates):
+        """Index a batch of candidates (bytes); returns how many were taken in.
+
+        Fewer than given are taken once the index is full or a collision is
+        found; the collision is then in ``self.collision``.
+        """
+        if self.collision is not None:
+            return 0
+        candidates = candidates[:self.max_entries - self.count]
+        if not candidates:
+            return 0
+
+        words = digest_words(candidates)
+        first_number = self.count
+        prefixes = (words >> self._prefix_shift) + np.uint64(1)
+        keys = (prefixes << self._shift) | (words & self._tag_mask)
+
+        # Distinct keys in order of first appearance, then the first key of each prefix
+        unique, first = np.unique(keys, return_index=True)
+        order = np.argsort(first, kind='stable')
+        unique, first = unique[order], first[order]
+        _, lead, group = np.unique(unique >> self._shift, return_index=True, return_inverse=True)
+        group = group.reshape(-1)
+
+        slots = self._find(unique[lead])
+        stored = self._keys[slots]
+        prefix_stored = stored != 0
+
+        # A candidate collides when its prefix was seen with another key: stored
+        # in the table, or an earlier key of this batch
+        clash = np.where(prefix_stored[group], stored[group] != unique, np.arange(len(unique)) != lead[group])
+        if clash.any():
+            hit = int(np.flatnonzero(clash)[0])
+            later = int(first[hit])
+            if prefix_stored[group[hit]]:
+                earlier = int(self._numbers[slots[group[hit]]])
+            else:
+                earlier = first_number + int(first[lead[group[hit]]])
+            self._found(earlier, first_number + later, candidates, first_number)
+            self.count += later + 1
+            CANDIDATES.inc(amount=later + 1)
+            return later + 1
+
+        new = ~prefix_stored
+        self._grow(self.entries + int(new.sum()))
+        self._insert(unique[lead][new], (first[lead][new] + first_number).astype(np.uint32))
+        self.entries += int(new.sum())
+        self.count += len(candidates)
+        CANDIDATES.inc(amount=len(candidates))
+        return len(candidates)
+
+    def _found(self, earlier, later, candidates, first_number):
+        def described(number):
+            if number < first_number:
+                # From an earlier batch: only its number is known
+                return {'number': number}
+            candidate = bytes(candidates[number - first_number])
+            return {'number': number, 'input': candidate.hex(), 'md5': hashlib.md5(candidate).hexdigest()}
+
+        self.collision = {
+            'bits': self.bits,
+            'prefix': described(later)['md5'][:(self.bits + 3) // 4],
+            'first': described(earlier),
+            'second': described(later),
+        }
+
+    def state(self):
+        return {
+            'bits': self.bits,
+            'candidates': self.count,
+            'entries': self.entries,
+            'capacity': self.max_entries,
+            'full': self.count >= self.max_entries,
+            'index_bytes': self.nbytes,
+        }
+
+
+class Sessions:
+    """Per-client indexes, least recently used dropped first."""
+
+    def __init__(self, bits=BITS, max_entries=MAX_ENTRIES, max_sessions=MAX_SESSIONS):
+        self.bits = bits
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, client):
+        with self._lock:
+            index = self._indexes.get(client)
+            if index is not None:
+                self._indexes.move_to_end(client)
+            else:
+                index = self._indexes[client] = Index(self.bits, self.max_entries)
+                while len(self._indexes) > self.max_sessions:
+                    self._indexes.popitem(last=False)
+            return index
+
+    def reset(self, client):
+        with self._lock:
+            return self._indexes.pop(client, None) is not None
+
+
+SESSIONS = Sessions()
@@ -0,0 +1,69 @@
+"""Vectorized PKCS#7 padding checks for the padding oracle level.
+
+A padding oracle query only ever changes the block in front of the target
+block, so the raw AES decryption of the target is computed once and cached.
+Every candidate is then a single XOR against that cached block, checked for
+the whole batch at once with NumPy instead of decrypt + unpad per query.
+"""
+from functools import lru_cache
+
+import numpy as np
+from Crypto.Cipher import AES
+
+BLOCK_SIZE = AES.block_size
+
+# Column index of every byte in a block, used to build the padding-tail mask
+_POSITIONS = np.arange(BLOCK_SIZE, dtype=np.int16)
+
+
+@lru_cache(maxsize=4096)
+def decrypt_block(key, block):
+    """Raw (pre-XOR) AES decryption of one ciphertext block, cached per (key, block)."""
+    decrypted = np.frombuffer(AES.new(key, AES.MODE_ECB).decrypt(block), dtype=np.uint8)
+    decrypted.flags.writeable = False
+    return decrypted
+
+
+def padding_valid(key, previous_blocks, target_block):
+    """Padding verdicts for many candidate previous blocks against one target block.
+
+    ``previous_blocks`` is an (N, 16) uint8 array. Returns a boolean array of
+    length N that matches ``unpad(..., AES.block_size)`` succeeding on the
+    final block of each candidate message.
+    """
+    plain = np.bitwise_xor(previous_blocks, decrypt_block(key, target_block))
+    pad_len = plain[:, -1].astype(np.int16)
+    in_range = (pad_len >= 1) & (pad_len <= BLOCK_SIZE)
+
+    # Bytes inside the claimed padding must all equal the padding length
+    in_tail = _POSITIONS >= (BLOCK_SIZE - pad_len)[:, None]
+    tail_ok = ((plain == pad_len[:, None].astype(np.uint8)) | ~in_tail).all(axis=1)
+
+    return in_range & tail_ok
+
+
+def check_ciphertexts(key, ciphertexts):
+    """Padding verdicts for a list of raw IV + ciphertext messages.
+
+    Mirrors the single-shot oracle: messages shorter than two blocks or not a
+    whole number of blocks are invalid. Candidates are grouped by their final
+    block so each distinct target is decrypted once per batch (and cached
+    across batches).
+    """
+    verdicts = np.zeros(len(ciphertexts), dtype=bool)
+    groups = {}
+
+    for i, ciphertext in enumerate(ciphertexts):
+        if len(ciphertext) < 2 * BLOCK_SIZE or len(ciphertext) % BLOCK_SIZE:
+            continue
+
+        target = bytes(ciphertext[-BLOCK_SIZE:])
+        indices, previous = groups.setdefault(target, ([], []))
+        indices.append(i)
+        previous.append(ciphertext[-2 * BLOCK_SIZE:-BLOCK_SIZE])
+
+    for target, (indices, previous) in groups.items():
+        blocks = np.frombuffer(b''.join(previous), dtype=np.uint8).reshape(-1, BLOCK_SIZE)
+        verdicts[indices] = padding_valid(key, blocks, target)
+
+    return verdicts
@@ -0,0 +1 @@
+"""Shared runtime support for the Python labs (crypto, ssrf)."""
@@ -0,0 +1,191 @@
+"""Per-client token-bucket admission control for brute-force endpoints.
+
+Each rule names a bucket, a refill rate (tokens per second) and a burst
+size. Every (bucket, lab instance, client IP) pair gets its own bucket, so
+one aggressive script only exhausts its own budget; endpoints that share a
+bucket name (the single, batch and streaming padding oracles) share it.
+
+Buckets live in striped dicts, each stripe with its own lock, so a check is
+O(1) and threads rarely contend. A bucket that has refilled completely is
+indistinguishable from a missing one, so when a stripe grows past its share
+of ``max_clients`` such buckets are dropped first (lazy eviction), then the
+oldest.
+
+A request is admitted if the bucket holds enough tokens for it (or is full,
+for costs larger than the burst); tokens may go negative, so large batches
+pass but are paid for. Rejected requests get 429 with Retry-After.
+
+Long-lived requests (the streaming oracle) each hold a server thread, which
+no rate covers; ``Concurrency`` caps how many are open, in all and per client.
+
+    LAB_RATE_LIMITS        "off", or overrides like "padding-oracle=500/2000,verify=1/5"
+    LAB_RATE_LIMIT_MESSAGE body of the 429 error
+"""
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from flask import current_app, jsonify, request
+
+from labkit import metrics
+
+MAX_CLIENTS = 100000
+STRIPES = 64
+
+REJECTED = metrics.REGISTRY.counter(
+    'lab_admission_rejected_total', 'Requests refused by rate limiting, per bucket.', ('bucket',))
+
+
+@dataclass(frozen=True)
+class Rule:
+    bucket: str
+    rate: float  # tokens per second
+    burst: float
+    per_request: bool = True  # False: the view charges per item with charge()
+
+
+class TokenBuckets:
+    def __init__(self, max_clients=MAX_CLIENTS, stripes=STRIPES):
+        self.max_per_stripe = max(1, max_clients // stripes)
+        self._stripes = [(threading.Lock(), {}) for _ in range(stripes)]
+
+    def take(self, key, rate, burst, cost=1):
+        """Charge ``cost`` tokens; returns 0 if admitted, else seconds until it would be."""
+        lock, buckets = self._stripes[hash(key) % len(self._stripes)]
+        now = time.monotonic()
+        with lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                if len(buckets) >= self.max_per_stripe:
+                    self._evict(buckets, now)
+                tokens = burst
+                bucket = buckets[key] = [burst, now, rate, burst]
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= min(cost, burst):
+                bucket[0] = tokens - cost
+                return 0
+            bucket[0] = tokens
+            return (min(cost, burst) - tokens) / rate
+
+    def _evict(self, buckets, now):
+        # Called with the stripe lock held: drop refilled buckets, then the oldest
+        # down to 90% so the sweep's cost is spread over many inserts
+        for key in [k for k, (tokens, last, rate, burst) in buckets.items() if tokens + (now - last) * rate >= burst]:
+            del buckets[key]
+        while len(buckets) > self.max_per_stripe * 0.9:
+            del buckets[next(iter(buckets))]
+
+    def __len__(self):
+        return sum(len(buckets) for _, buckets in self._stripes)
+
+
+class Concurrency:
+    """Holders of something scarce, such as a server thread: ``limit`` in all, ``per_client`` each.
+
+    Rate limits do not bound requests that stay open; this does. Refusals are
+    counted in ``lab_admission_rejected_total`` under ``name``.
+    """
+
+    def __init__(self, name, limit, per_client):
+        self.name = name
+        self.limit = limit
+        self.per_client = per_client
+        self.total = 0
+        self._held = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, client):
+        """None if a slot was taken for ``client``; else 'client' (at its own limit) or 'full'."""
+        with self._lock:
+            held = self._held.get(client, 0)
+            if held >= self.per_client:
+                refused = 'client'
+            elif self.total >= self.limit:
+                refused = 'full'
+            else:
+                self._held[client] = held + 1
+                self.total += 1
+                return None
+        REJECTED.inc(self.name)
+        return refused
+
+    def release(self, client):
+        with self._lock:
+            held = self._held.pop(client) - 1
+            if held:
+                self._held[client] = held
+            self.total -= 1
+
+
+BUCKETS = TokenBuckets()
+metrics.REGISTRY.gauge('lab_admission_buckets', 'Client token buckets currently held.',
+                       lambda: [({}, len(BUCKETS))])
+
+
+def _overrides(spec):
+    overrides = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        rate, _, burst = value.partition('/')
+        overrides[name.strip()] = (float(rate), float(burst or rate))
+    return overrides
+
+
+def _rejected(rule, retry_after):
+    REJECTED.inc(rule.bucket)
+    message = current_app.config.get('RATE_LIMIT_MESSAGE') or os.environ.get(
+        'LAB_RATE_LIMIT_MESSAGE', 'Too many requests, slow down')
+    response = jsonify({'error': message, 'retry_after': round(retry_after, 3)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _key(rule):
+    return (rule.bucket, current_app.config.get('TENANT_ID'), request.remote_addr)
+
+
+def retry_after(cost=1):
+    """Charge ``cost`` to the current endpoint's bucket; 0 if admitted, else seconds to wait."""
+    rule = current_app.extensions['admission'].get(request.endpoint)
+    if rule is None:
+        return 0
+    wait = BUCKETS.take(_key(rule), rule.rate, rule.burst, cost)
+    if wait:
+        REJECTED.inc(rule.bucket)
+    return wait
+
+
+def charge(cost):
+    """For per-item endpoints: None if admitted, else the 429 response to return."""
+    rule = current_app.extensions['admission'].get(request.endpoint)
+    if rule is None:
+        return None
+    wait = BUCKETS.take(_key(rule), rule.rate, rule.burst, cost)
+    return _rejected(rule, wait) if wait else None
+
+
+def _before_request():
+    rule = current_app.extensions['admission'].get(request.endpoint)
+    if rule is not None and rule.per_request:
+        wait = BUCKETS.take(_key(rule), rule.rate, rule.burst)
+        if wait:
+            return _rejected(rule, wait)
+
+
+def init_app(app, rules):
+    """Rate-limit ``app``'s endpoints; ``rules`` maps endpoint name to Rule."""
+    spec = os.environ.get('LAB_RATE_LIMITS', '')
+    if spec.strip().lower() == 'off':
+        app.extensions['admission'] = {}
+        return
+    overrides = _overrides(spec)
+    app.extensions['admission'] = {
+        endpoint: Rule(rule.bucket, *overrides[rule.bucket], rule.per_request) if rule.bucket in overrides else rule
+        for endpoint, rule in rules.items()
+    }
+    app.before_request(_before_request)
@@ -0,0 +1,211 @@
+"""Opt-in traffic capture for replaying real lab sessions (bench/replay.py).
+
+With LAB_CAPTURE set, every request a lab app serves is appended to that
+file as one compact JSON line once its response has been sent:
+
+    {"t":1760662000.125,"c":"4f1c2a9e0b7d","tenant":null,"m":"POST",
+     "p":"/api/crypto/padding-oracle/batch?size=32","route":"/api/crypto/padding-oracle/batch",
+     "type":"application/octet-stream","status":200,"ms":2.41,"in":8192,"out":86,"b64":"..."}
+
+``t`` is when the request arrived, ``ms`` the time until the last response
+byte (streamed bodies included), ``in``/``out`` the body sizes. Bodies that
+are valid UTF-8 are kept as ``body``, others base64 in ``b64``; past
+LAB_CAPTURE_MAX_BODY bytes they are cut and ``cut`` is set. Clients are
+recorded as a keyed hash of their address (``c``), enough to group a
+session without keeping IPs. Headers other than Content-Type are not kept.
+
+The body is copied as the app reads it, so streaming uploads still stream;
+whatever the app left unread is read after the response, up to the limit.
+Each record is a single O_APPEND write, so several workers can share one
+file. /metrics scrapes and health probes are not recorded.
+
+    LAB_CAPTURE            file to append records to       (default: off)
+    LAB_CAPTURE_MAX_BODY   request body bytes kept          (default: 1048576)
+    LAB_CAPTURE_SALT       key for client hashes            (default: random per process)
+"""
+import base64
+import hashlib
+import json
+import os
+import secrets
+import time
+
+from flask import current_app, request
+
+from labkit import metrics
+
+MAX_BODY = 1024 * 1024
+SKIP_PATHS = frozenset({'/metrics', '/healthz', '/readyz'})
+_DRAIN_CHUNK = 64 * 1024
+
+RECORDS = metrics.REGISTRY.counter(
+    'lab_capture_records_total', 'Captured request records by outcome (written, failed).', ('outcome',))
+
+
+class CaptureLog:
+    """Append-only NDJSON file shared by every thread (and forked worker)."""
+
+    def __init__(self, path, salt=None):
+        self.path = path
+        self.salt = (salt or secrets.token_hex(16)).encode()
+        self._fd = None
+        self._pid = None
+
+    def client(self, address):
+        return hashlib.blake2b((address or '').encode(), key=self.salt[:64], digest_size=6).hexdigest()
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':')).encode() + b'\n'
+        try:
+            if self._pid != os.getpid():
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+            os.write(self._fd, line)
+        except OSError:
+            RECORDS.inc('failed')
+            return
+        RECORDS.inc('written')
+
+
+class _Body:
+    """wsgi.input wrapper keeping a copy of the first ``limit`` bytes read."""
+
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self.limit = limit
+        self.kept = bytearray()
+        self.length = 0
+
+    def _keep(self, data):
+        self.length += len(data)
+        if len(self.kept) < self.limit:
+            self.kept += data[:self.limit - len(self.kept)]
+        return data
+
+    def read(self, *args):
+        return self._keep(self._stream.read(*args))
+
+    def readline(self, *args):
+        return self._keep(self._stream.readline(*args))
+
+    def readlines(self, *args):
+        return [self._keep(line) for line in self._stream.readlines(*args)]
+
+    def __iter__(self):
+        for line in self._stream:
+            yield self._keep(line)
+
+    def drain(self, content_length):
+        # Only up to Content-Length, so a keep-alive connection is never over-read
+        remaining = min(content_length - self.length, self.limit - len(self.kept))
+        try:
+            while remaining > 0:
+                data = self.read(min(remaining, _DRAIN_CHUNK))
+                if not data:
+                    break
+                remaining -= len(data)
+        except (OSError, ValueError):
+            pass
+
+
+class _Recorded:
+    """Response iterable that writes the record when the server closes it."""
+
+    def __init__(self, iterable, on_close):
+        self._iterable = iterable
+        self._on_close = on_close
+        self.length = 0
+
+    def __iter__(self):
+        for chunk in self._iterable:
+            self.length += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._on_close(self.length)
+
+
+class CaptureMiddleware:
+    def __init__(self, wsgi_app, log, max_body=MAX_BODY):
+        self.wsgi_app = wsgi_app
+        self.log = log
+        self.max_body = max_body
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '') in SKIP_PATHS:
+            return self.wsgi_app(environ, start_response)
+
+        arrived, started = time.time(), time.perf_counter()
+        body = environ['wsgi.input'] = _Body(environ['wsgi.input'], self.max_body)
+        status = []
+
+        def capturing_start_response(status_line, headers, exc_info=None):
+            status[:] = [status_line]
+            return start_response(status_line, headers, exc_info)
+
+        def record(sent):
+            elapsed = time.perf_counter() - started
+            try:
+                content_length = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                content_length = 0
+            if content_length > body.length:
+                body.drain(content_length)
+            self.log.write(self._record(environ, arrived, elapsed, status, body, sent))
+
+        return _Recorded(self.wsgi_app(environ, capturing_start_response), record)
+
+    def _record(self, environ, arrived, elapsed, status, body, sent):
+        path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+        if environ.get('QUERY_STRING'):
+            path += '?' + environ['QUERY_STRING']
+        record = {
+            't': round(arrived, 3),
+            'c': self.log.client(environ.get('REMOTE_ADDR')),
+            'tenant': environ.get('labkit.capture.tenant'),
+            'm': environ.get('REQUEST_METHOD', 'GET'),
+            'p': path,
+            'route': environ.get('labkit.capture.route'),
+            'type': environ.get('CONTENT_TYPE') or None,
+            'status': int(status[0].split(None, 1)[0]) if status else 0,
+            'ms': round(elapsed * 1000, 2),
+            'in': body.length,
+            'out': sent,
+        }
+        if body.kept:
+            kept = bytes(body.kept)
+            try:
+                record['body'] = kept.decode('utf-8')
+            except UnicodeDecodeError:
+                record['b64'] = base64.b64encode(kept).decode('ascii')
+            if body.length > len(kept):
+                record['cut'] = True
+        return record
+
+
+def _note_route(response):
+    # The URL rule is only known inside the app; hand it to the middleware
+    environ = request.environ
+    environ['labkit.capture.route'] = request.url_rule.rule if request.url_rule is not None else None
+    environ['labkit.capture.tenant'] = current_app.config.get('TENANT_ID')
+    return response
+
+
+_logs = {}
+
+
+def init_app(app):
+    """Record ``app``'s requests to LAB_CAPTURE, if set."""
+    path = os.environ.get('LAB_CAPTURE')
+    if not path:
+        return
+    log = _logs.get(path)
+    if log is None:
+        # One log per file, shared by every app of a multi-tenant process
+        log = _logs[path] = CaptureLog(path, os.environ.get('LAB_CAPTURE_SALT'))
+    app.wsgi_app = CaptureMiddleware(app.wsgi_app, log, int(os.environ.get('LAB_CAPTURE_MAX_BODY', MAX_BODY)))
+    app.after_request(_note_route)
@@ -0,0 +1,249 @@
+"""Structured lab events for scoring and anti-cheat analytics.
+
+Handlers report what a student achieved with ``events.emit(level, outcome)``;
+each call becomes one fixed-shape record:
+
+    {"t":1760662000.125,"lab":"crypto","tenant":null,"route":"/api/crypto/verify",
+     "level":"medium","outcome":"incorrect","n":1,"ms":0.41,"client":"10.0.0.5"}
+
+``n`` is how many items the request carried (candidates of a batch), ``ms``
+the time since the request started (or the item's own time, for streams).
+
+emit() never blocks and never does I/O. It takes the next sequence number
+(``next()`` on an itertools.count, atomic under the GIL) and stores a tuple
+in that slot of a preallocated ring, with no lock. A background thread,
+started on first use in each process (so after a fork as well), drains the
+ring every LAB_EVENTS_INTERVAL seconds, or sooner when it fills up. It
+batches the records as NDJSON into LAB_EVENTS: a file (appended to, one
+write per batch, so workers can share it) or ``unix:/path`` for a Unix
+stream socket the orchestrator listens on.
+
+Nothing waits for the flusher. If emitters lap it, the overwritten events
+are dropped. Batches the sink cannot take (socket down) are dropped too,
+not retried. Both are counted in ``lab_events_dropped_total``.
+
+    LAB_EVENTS             file, or unix:/path/to.sock     (default: off)
+    LAB_EVENTS_BUFFER      ring slots, a power of two     (default: 65536)
+    LAB_EVENTS_INTERVAL    seconds between flushes         (default: 0.5)
+"""
+import atexit
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from json.encoder import encode_basestring
+
+from flask import current_app, request
+
+from labkit import metrics
+
+FIELDS = ('t', 'lab', 'tenant', 'route', 'level', 'outcome', 'n', 'ms', 'client')
+BUFFER = 65536
+INTERVAL = 0.5
+
+WRITTEN = metrics.REGISTRY.counter('lab_events_written_total', 'Lab events handed to the sink.')
+DROPPED = metrics.REGISTRY.counter(
+    'lab_events_dropped_total', 'Lab events lost, by reason (overflow, sink).', ('reason',))
+
+
+class Ring:
+    """Fixed-size ring many threads push to and one thread drains.
+
+    Each slot holds ``(sequence number, event)``. A slot still holding an
+    older number has not been written yet; a newer one means the drainer
+    was lapped and the events in between were overwritten.
+    """
+
+    def __init__(self, size=BUFFER):
+        if size < 4 or size & (size - 1):
+            raise ValueError('ring size must be a power of two')
+        self.size = size
+        self._mask = size - 1
+        self._slots = [None] * size
+        self._sequence = itertools.count()
+        self._read = 0
+
+    def push(self, event):
+        """Store ``event``; returns its sequence number."""
+        sequence = next(self._sequence)
+        self._slots[sequence & self._mask] = (sequence, event)
+        return sequence
+
+    def drain(self):
+        """Events pushed since the last drain, in order, and how many were lost."""
+        slots, mask, read = self._slots, self._mask, self._read
+        events = []
+        lost = 0
+        while True:
+            slot = slots[read & mask]
+            if slot is None or slot[0] < read:
+                break
+            if slot[0] > read:
+                # Lapped: only the newest ``size`` events can still be in the ring
+                oldest = slot[0] - self.size + 1
+                lost += oldest - read
+                read = oldest
+                continue
+            events.append(slot[1])
+            read += 1
+        self._read = read
+        return events, lost
+
+
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def write(self, data):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, data)
+
+    def reset(self):
+        # After a fork: the child opens its own descriptor
+        self._fd = None
+
+
+class SocketSink:
+    def __init__(self, path):
+        self.path = path
+        self._sock = None
+
+    def write(self, data):
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(1.0)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        try:
+            self._sock.sendall(data)
+        except OSError:
+            self.reset()
+            raise
+
+    def reset(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+
+
+def open_sink(target):
+    if target.startswith('unix:'):
+        return SocketSink(target[len('unix:'):])
+    return FileSink(target)
+
+
+# Records are formatted by hand: json.dumps of a dict costs three times as much
+_TEMPLATE = ('{"t":%.3f,"lab":%s,"tenant":%s,"route":%s,"level":%s,"outcome":%s,'
+             '"n":%d,"ms":%s,"client":%s}')
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _json(value):
+    if value.__class__ is str:
+        return encode_basestring(value)
+    return 'null' if value is None else _encode(value)
+
+
+def _record(event):
+    t, lab, tenant, route, level, outcome, count, elapsed, client = event
+    return _TEMPLATE % (t, _json(lab), _json(tenant), _json(route), _json(level), _json(outcome), count,
+                        'null' if elapsed is None else '%.3f' % (elapsed * 1e3), _json(client))
+
+
+class Pipeline:
+    """A ring plus the thread that flushes it to a sink."""
+
+    def __init__(self, sink, size=BUFFER, interval=INTERVAL):
+        self.sink = sink
+        self.size = size
+        self.interval = interval
+        self.ring = Ring(size)
+        self._wake_mask = size // 4 - 1
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.flush)
+
+    def _after_fork(self):
+        # The parent's ring and thread do not survive a fork
+        self.ring = Ring(self.size)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.sink.reset()
+
+    def push(self, event):
+        if self._thread is None:
+            self._start()
+        if not self.ring.push(event) & self._wake_mask:
+            # A quarter of the ring since the last wake-up: flush early
+            self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='lab-events', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            events, lost = self.ring.drain()
+            if lost:
+                DROPPED.inc('overflow', amount=lost)
+            if not events:
+                return
+            try:
+                self.sink.write(('\n'.join(map(_record, events)) + '\n').encode())
+            except OSError:
+                DROPPED.inc('sink', amount=len(events))
+                return
+            WRITTEN.inc(amount=len(events))
+
+
+def emit(level, outcome, count=1, elapsed=None):
+    """Record ``outcome`` at ``level`` for the current request, if events are on."""
+    if not _pipelines:
+        return
+    # Resolved once: every attribute read through a Flask proxy costs more than the push
+    app = current_app._get_current_object()
+    pipeline = app.extensions.get('events')
+    if pipeline is None:
+        return
+    req = request._get_current_object()
+    if elapsed is None:
+        elapsed = metrics.request_elapsed()
+    rule = req.url_rule
+    pipeline.push((time.time(), req.blueprint, app.config.get('TENANT_ID'),
+                   rule.rule if rule is not None else None, level, outcome, count, elapsed, req.remote_addr))
+
+
+_pipelines = {}
+
+
+def init_app(app):
+    """Send ``app``'s events to LAB_EVENTS, if set."""
+    target = os.environ.get('LAB_EVENTS')
+    if not target:
+        return
+    pipeline = _pipelines.get(target)
+    if pipeline is None:
+        # One pipeline per sink, shared by every app of a multi-tenant process
+        pipeline = _pipelines[target] = Pipeline(open_sink(target), int(os.environ.get('LAB_EVENTS_BUFFER', BUFFER)),
+                                                 float(os.environ.get('LAB_EVENTS_INTERVAL', INTERVAL)))
+    app.extensions['events'] = pipeline
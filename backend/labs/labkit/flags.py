@@ -0,0 +1,88 @@
+"""Per-instance flags derived from the sandbox owner.
+
+Each lab declares its base flags (the ones in lab_configurations.flags). With
+LAB_FLAG_SECRET set, every instance serves its own variant of each, derived
+once at startup:
+
+    FLAG{w34k_c1ph3r_cr4ck3d}  ->  FLAG{w34k_c1ph3r_cr4ck3d_3f9a1c07d2e4}
+
+The suffix is the first 12 hex digits of HMAC-SHA256(secret, "<user>:<base flag>").
+The owner is the container's USER_ID, or the tenant id in multi-tenant mode.
+The backend derives the same value when a flag is submitted
+(src/services/sandbox.service.ts), so a flag leaked by one student is useless
+to the others. Without a secret the base flags are served unchanged.
+
+Submissions are checked against SHA-256 digests of the flags computed at
+startup, with a constant-time comparison.
+
+    LAB_FLAG_SECRET        key flags are derived with  (default: unset = base flags)
+    USER_ID                instance owner, set by the sandbox orchestrator
+"""
+import hashlib
+import hmac
+import os
+import secrets
+
+TAG_LENGTH = 12
+
+
+def derive(base, secret, owner):
+    """The instance's variant of ``base`` (``FLAG{...}``)."""
+    if not secret:
+        return base
+    tag = hmac.new(secret.encode(), f'{owner}:{base}'.encode(), hashlib.sha256).hexdigest()[:TAG_LENGTH]
+    return f'{base[:-1]}_{tag}}}'
+
+
+class FlagSet:
+    def __init__(self, base_flags, secret=None, owner=''):
+        self.secret = secret
+        self.owner = owner
+        self.base = dict(base_flags)
+        self.flags = {level: derive(base, secret, owner) for level, base in self.base.items()}
+        self._digests = {level: hashlib.sha256(flag.encode()).digest() for level, flag in self.flags.items()}
+        self._unknown = secrets.token_bytes(32)
+        # Base flag bytes -> instance flag bytes, for files and documents baked into the image
+        self._substitutions = [(base.encode(), self.flags[level].encode())
+                               for level, base in self.base.items() if self.flags[level] != base]
+
+    def __getitem__(self, level):
+        return self.flags[level]
+
+    def verify(self, level, submitted):
+        """Whether ``submitted`` is this instance's flag for ``level``, in constant time."""
+        if not isinstance(submitted, str):
+            return False
+        expected = self._digests.get(level, self._unknown)
+        return hmac.compare_digest(hashlib.sha256(submitted.encode()).digest(), expected) and level in self._digests
+
+    def code(self, label, digits=5):
+        """A numeric code for ``label`` derived like the flags; None without a secret."""
+        if not self.secret:
+            return None
+        mac = hmac.new(self.secret.encode(), f'{self.owner}:{label}'.encode(), hashlib.sha256).digest()
+        return f'{int.from_bytes(mac[:8], "big") % 10 ** digits:0{digits}d}'
+
+    def substitute(self, data):
+        """``data`` (bytes) with every base flag replaced by the instance's flag."""
+        for base, flag in self._substitutions:
+            data = data.replace(base, flag)
+        return data
+
+
+def from_env(base_flags, owner=None):
+    """FlagSet for this process's owner (USER_ID) unless ``owner`` is given."""
+    return FlagSet(base_flags, os.environ.get('LAB_FLAG_SECRET') or None,
+                   os.environ.get('USER_ID', '') if owner is None else owner)
+
+
+def init_app(app, base_flags):
+    """Derive ``app``'s flags once; the FlagSet is app.extensions['flags'].
+
+    The tenant id, when set, is the owner; app.config FLAG_SECRET overrides the env.
+    """
+    owner = app.config.get('TENANT_ID')
+    secret = app.config.get('FLAG_SECRET') or os.environ.get('LAB_FLAG_SECRET') or None
+    flag_set = FlagSet(base_flags, secret, os.environ.get('USER_ID', '') if owner is None else str(owner))
+    app.extensions['flags'] = flag_set
+    return flag_set
@@ -0,0 +1,116 @@
+"""Liveness and readiness probes for the lab containers.
+
+    GET /healthz   200 as long as the process answers requests
+    GET /readyz    200 once the instance is fully built and every check
+                   passes, else 503 with what is missing
+
+Labs call ``init_app(app)`` early in ``create_app`` and ``mark_ready(app)``
+as its last step, after flags, artifacts and pages are precomputed, so a
+probe never sees a half-built instance. ``add_check(app, name, fn)``
+registers extra conditions (``fn()`` returns True when satisfied). Both
+answers report ``startup_seconds``: process start (interpreter boot
+included) to the first instance being ready, also exported as the
+``lab_startup_seconds`` metric.
+
+``python3 -m labkit.health`` probes /readyz on 127.0.0.1:LAB_PORT and exits
+0 or 1. It imports nothing heavy, so Docker's HEALTHCHECK can run it often.
+"""
+import json
+import os
+import time
+
+_imported = time.time()
+_ready_at = None
+
+
+def _process_started():
+    """Unix time this process was started, from /proc where available."""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/stat') as f:
+            boot = next(int(line.split()[1]) for line in f if line.startswith('btime '))
+        return boot + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _imported
+
+
+PROCESS_STARTED = _process_started()
+
+
+def startup_seconds():
+    """Seconds from process start to the first ready instance; None before."""
+    if _ready_at is None:
+        return None
+    return round(max(0.0, _ready_at - PROCESS_STARTED), 3)
+
+
+def restart_clock(started=None):
+    """Count startup from ``started`` (default: now), for a process forked from a preloaded parent."""
+    global PROCESS_STARTED, _ready_at
+    PROCESS_STARTED = time.time() if started is None else started
+    _ready_at = None
+
+
+def status(app=None):
+    """(HTTP status, body) of a readiness probe for ``app`` (None: the process)."""
+    state = app.extensions['health'] if app is not None else {'ready': _ready_at is not None, 'checks': {}}
+    if not state['ready']:
+        return 503, {'status': 'starting'}
+    failing = [name for name, check in state['checks'].items() if not check()]
+    if failing:
+        return 503, {'status': 'unavailable', 'failing': failing}
+    return 200, {'status': 'ready', 'startup_seconds': startup_seconds()}
+
+
+def liveness():
+    return 200, {'status': 'ok', 'startup_seconds': startup_seconds()}
+
+
+def init_app(app):
+    """Serve /healthz and /readyz for ``app``; it reports ready after mark_ready()."""
+    from labkit import metrics
+
+    app.extensions['health'] = {'ready': False, 'checks': {}}
+
+    def respond(result):
+        code, body = result
+        return app.response_class(json.dumps(body), status=code, mimetype='application/json')
+
+    app.add_url_rule('/healthz', 'healthz', lambda: respond(liveness()))
+    app.add_url_rule('/readyz', 'readyz', lambda: respond(status(app)))
+    # Registered by name, so every app of a multi-tenant process shares it
+    metrics.REGISTRY.gauge('lab_startup_seconds', 'Process start to the first lab instance being ready.',
+                           lambda: [({}, startup_seconds())] if _ready_at is not None else [])
+
+
+def add_check(app, name, check):
+    app.extensions['health']['checks'][name] = check
+
+
+def mark_ready(app=None):
+    """``app`` is fully built; None marks the process itself (a tenant dispatcher)."""
+    global _ready_at
+    if app is not None:
+        app.extensions['health']['ready'] = True
+    if _ready_at is None:
+        _ready_at = time.time()
+
+
+def probe(port=None, timeout=2.0):
+    """Whether the lab on this host answers /readyz with 200."""
+    import http.client
+
+    conn = http.client.HTTPConnection('127.0.0.1', int(port or os.environ.get('LAB_PORT', 80)), timeout=timeout)
+    try:
+        conn.request('GET', '/readyz')
+        return conn.getresponse().status == 200
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if probe() else 1)
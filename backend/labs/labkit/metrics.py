@@ -0,0 +1,279 @@
+"""Low-overhead Prometheus-text metrics for the Python labs.
+
+Every thread records into its own shard (plain dicts), so the hot path is a
+dict update with no locks and no I/O; the lock is only taken the first time
+a thread records anything and when ``/metrics`` merges the shards. Shards of
+threads that have exited are folded into a retired shard so servers that
+spawn a thread per request do not grow without bound.
+
+Metrics are process-wide: in multi-tenant mode all tenants share them, and
+they carry client addresses, so there only loopback scrapers (or ones with
+the token) may read them.
+
+    LAB_METRICS_TOKEN  bearer token /metrics requires (default: unset = none)
+"""
+import hmac
+import ipaddress
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, current_app, g, request
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Distinct per-client label values kept before falling back to "other"
+MAX_CLIENT_LABELS = 1000
+
+TOKEN = os.environ.get('LAB_METRICS_TOKEN') or None
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class _Shard:
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}    # (name, label values) -> number
+        self.histograms = {}  # (name, label values) -> [bucket counts..., +Inf count, sum]
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = _Shard(None)
+        self._metrics = {}  # name -> metric, in registration order
+        self._clients = set()
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+                if len(self._shards) > 256:
+                    self._retire_dead()
+            return shard
+
+    def _retire_dead(self):
+        # Called with the lock held
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                _merge(self._retired, shard)
+        self._shards = alive
+
+    def client_label(self, client):
+        """Bounded-cardinality label for a client address."""
+        if client in self._clients:
+            return client
+        with self._lock:
+            if len(self._clients) < MAX_CLIENT_LABELS:
+                self._clients.add(client)
+                return client
+        return 'other'
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name, help, collect):
+        """Gauge evaluated at scrape time; ``collect()`` returns [(labels dict, value)]."""
+        return self.register(Gauge(name, help, collect))
+
+    def snapshot(self):
+        merged = _Shard(None)
+        with self._lock:
+            self._retire_dead()
+            _merge(merged, self._retired)
+            for shard in self._shards:
+                _merge(merged, shard)
+        return merged
+
+    def render(self):
+        merged = self.snapshot()
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render(merged))
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(into, shard):
+    # list() copies each dict in one C call, so owner threads may keep writing
+    for key, value in list(shard.counters.items()):
+        into.counters[key] = into.counters.get(key, 0) + value
+    for key, values in list(shard.histograms.items()):
+        values = list(values)
+        existing = into.histograms.get(key)
+        if existing is None:
+            into.histograms[key] = values
+        else:
+            for i, v in enumerate(values):
+                existing[i] += v
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, help, labelnames):
+        self.registry, self.name, self.help, self.labelnames = registry, name, help, labelnames
+
+    def inc(self, *labels, amount=1):
+        counters = self.registry.shard().counters
+        key = (self.name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def render(self, merged):
+        for (name, labels), value in sorted(merged.counters.items()):
+            if name == self.name:
+                yield f'{name}{_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames, buckets):
+        self.registry, self.name, self.help, self.labelnames = registry, name, help, labelnames
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        histograms = self.registry.shard().histograms
+        key = (self.name, labels)
+        values = histograms.get(key)
+        if values is None:
+            values = histograms[key] = [0] * (len(self.buckets) + 2)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def render(self, merged):
+        for (name, labels), values in sorted(merged.histograms.items()):
+            if name != self.name:
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f'{name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{name}_sum{_labels(self.labelnames, labels)} {values[-1]}'
+            yield f'{name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Gauge:
+    type = 'gauge'
+
+    def __init__(self, name, help, collect):
+        self.name, self.help, self.collect = name, help, collect
+
+    def render(self, merged):
+        for labels, value in self.collect():
+            yield f'{self.name}{_labels(labels.keys(), labels.values())} {value}'
+
+
+def _resident_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'lab_http_requests_total', 'HTTP requests by route, method and status.', ('route', 'method', 'status'))
+HTTP_ERRORS = REGISTRY.counter(
+    'lab_http_request_errors_total', 'HTTP requests that ended in a 5xx response.', ('route',))
+HTTP_LATENCY = REGISTRY.histogram(
+    'lab_http_request_duration_seconds', 'Time to produce the response (streamed bodies excluded).', ('route',))
+ORACLE_QUERIES = REGISTRY.counter(
+    'lab_oracle_queries_total', 'Padding oracle queries answered, per client.', ('client', 'mode'))
+OUTBOUND_DURATION = REGISTRY.histogram(
+    'lab_outbound_fetch_duration_seconds', 'Duration of outbound SSRF fetches.', ('level', 'outcome'))
+OUTBOUND_BYTES = REGISTRY.counter(
+    'lab_outbound_fetch_bytes_total', 'Response bytes received by outbound SSRF fetches.', ('level',))
+REGISTRY.gauge('lab_process_resident_memory_bytes', 'Resident set size of this process.',
+               lambda: [({}, _resident_bytes())])
+REGISTRY.gauge('lab_process_start_time_seconds', 'Unix time the process started.',
+               lambda start=time.time(): [({}, start)])
+
+
+def count_oracle_queries(mode, count=1):
+    ORACLE_QUERIES.inc(REGISTRY.client_label(request.remote_addr or 'unknown'), mode, amount=count)
+
+
+def _before_request():
+    g._metrics_started = time.perf_counter()
+
+
+def request_elapsed():
+    """Seconds since the current request started, or None if it is not being measured."""
+    started = g._get_current_object().get('_metrics_started')
+    return None if started is None else time.perf_counter() - started
+
+
+def _after_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_LATENCY.observe(time.perf_counter() - started, route)
+        HTTP_REQUESTS.inc(route, request.method, response.status_code)
+        if response.status_code >= 500:
+            HTTP_ERRORS.inc(route)
+    return response
+
+
+def scrape_allowed(environ, shared):
+    """Whether a request may read /metrics; ``shared`` when the process hosts several tenants."""
+    if TOKEN is not None:
+        supplied = environ.get('HTTP_AUTHORIZATION', '').encode('latin-1')
+        return hmac.compare_digest(supplied, f'Bearer {TOKEN}'.encode())
+    if not shared:
+        return True
+    try:
+        return ipaddress.ip_address(environ.get('REMOTE_ADDR', '')).is_loopback
+    except ValueError:
+        return False
+
+
+def render_response():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _metrics():
+    if not scrape_allowed(request.environ, current_app.config.get('TENANT_ID') is not None):
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return render_response()
+
+
+def init_app(app):
+    """Record request metrics for ``app`` and expose them on /metrics."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', _metrics)
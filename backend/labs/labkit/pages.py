@@ -0,0 +1,74 @@
+"""Pages rendered once and served as precompressed bytes.
+
+The lab home pages never change after startup, so the app renders each one
+when it is created and keeps identity, gzip and (if the ``brotli`` package is
+installed) brotli bodies. Every variant carries a strong ETag; a matching
+If-None-Match gets ``304 Not Modified`` without a body.
+
+Pages are immutable once built, so ``PrecompressedPage.shared`` hands every
+app of a process (each tenant, say) the same instance instead of running
+brotli at quality 11 again. The process only keeps a weak reference: a page
+goes away with the last app holding it, so evicted tenants (whose pages
+carry their own flags) do not pile up.
+"""
+import gzip
+import hashlib
+import weakref
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip and identity are always available
+    brotli = None
+
+
+_shared = weakref.WeakValueDictionary()
+
+
+class PrecompressedPage:
+    @classmethod
+    def shared(cls, body, mimetype='text/html; charset=utf-8'):
+        """The process-wide page for ``body``, built on first use."""
+        key = (hashlib.sha256(body).digest(), mimetype)
+        page = _shared.get(key)
+        if page is None:
+            page = _shared.setdefault(key, cls(body, mimetype))
+        return page
+
+    def __init__(self, body, mimetype='text/html; charset=utf-8'):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        # encoding -> (body, headers); identity is last so it is the fallback
+        self.variants = {}
+        if brotli is not None:
+            self._add('br', brotli.compress(body, quality=11), f'{digest}-br', mimetype)
+        self._add('gzip', gzip.compress(body, compresslevel=9, mtime=0), f'{digest}-gz', mimetype)
+        self._add('identity', body, digest, mimetype)
+
+    def _add(self, encoding, body, etag, mimetype):
+        headers = [
+            ('Content-Type', mimetype),
+            ('ETag', f'"{etag}"'),
+            ('Vary', 'Accept-Encoding'),
+            ('Cache-Control', 'no-cache'),
+        ]
+        if encoding != 'identity':
+            headers.append(('Content-Encoding', encoding))
+        self.variants[encoding] = (body, etag, headers)
+
+    def _choose(self):
+        accepted = request.accept_encodings
+        best, best_quality = 'identity', 0
+        for encoding in self.variants:
+            quality = accepted[encoding]
+            if encoding != 'identity' and quality > best_quality:
+                best, best_quality = encoding, quality
+        return self.variants[best]
+
+    def response(self):
+        """Response for the current request: 304, or the best-encoded body."""
+        body, etag, headers = self._choose()
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=headers[1:])
+        return Response(body, headers=headers)
@@ -0,0 +1,111 @@
+"""Serving entry point shared by the Python labs.
+
+Each lab exposes a ``create_app()`` factory and ends with
+``serving.run(create_app)``. The server is picked with environment variables
+so the Dockerfiles and the sandbox orchestrator can switch modes without
+code changes:
+
+    LAB_SERVER            gunicorn | dev            (default: dev)
+    LAB_HOST / LAB_PORT   bind address              (default: 0.0.0.0:80)
+    LAB_WORKERS           gunicorn worker processes (default: 1)
+    LAB_THREADS           threads per worker        (default: 8)
+    LAB_PRELOAD           build the app before fork (default: 1)
+    LAB_GRACEFUL_TIMEOUT  seconds to drain on SIGTERM (default: 10)
+    LAB_KEEPALIVE         keep-alive seconds        (default: 5)
+    LAB_MULTI_TENANT      1 = serve many instances from this process,
+                          see labkit.tenancy         (default: 0)
+
+Lab state (issued tokens, counters) lives in process memory, so more than one
+worker splits it between processes; scale with LAB_THREADS first.
+"""
+import os
+import signal
+import sys
+
+from labkit import tenancy
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def application(factory):
+    """The WSGI app to serve: one lab instance, or a tenant dispatcher."""
+    if os.environ.get('LAB_MULTI_TENANT') == '1':
+        return tenancy.from_env(factory)
+    return factory()
+
+
+def gunicorn_options():
+    """Gunicorn settings derived from the LAB_* environment."""
+    threads = _env_int('LAB_THREADS', 8)
+    return {
+        'bind': f"{os.environ.get('LAB_HOST', '0.0.0.0')}:{_env_int('LAB_PORT', 80)}",
+        'workers': _env_int('LAB_WORKERS', 1),
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'preload_app': os.environ.get('LAB_PRELOAD', '1') == '1',
+        'graceful_timeout': _env_int('LAB_GRACEFUL_TIMEOUT', 10),
+        'keepalive': _env_int('LAB_KEEPALIVE', 5),
+        'accesslog': '-',
+        'errorlog': '-',
+    }
+
+
+def _run_gunicorn(load, options):
+    from gunicorn.app.base import BaseApplication
+
+    class LabApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load()
+
+    LabApplication().run()
+
+
+def run_gunicorn(factory, options=None):
+    _run_gunicorn(lambda: application(factory), options or gunicorn_options())
+
+
+def run_dev(factory):
+    from werkzeug.serving import run_simple
+
+    # PID 1 in a container ignores SIGTERM unless a handler is installed,
+    # which would make every `docker stop` wait for the SIGKILL timeout.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    run_simple(
+        os.environ.get('LAB_HOST', '0.0.0.0'),
+        _env_int('LAB_PORT', 80),
+        application(factory),
+        threaded=True,
+    )
+
+
+def serve(app, sock):
+    """Serve an already built WSGI ``app`` on the listening ``sock`` (see labkit.zygote)."""
+    server = os.environ.get('LAB_SERVER', 'dev')
+    if server == 'gunicorn':
+        os.set_inheritable(sock.fileno(), True)
+        _run_gunicorn(lambda: app, dict(gunicorn_options(), bind=f'fd://{sock.fileno()}'))
+    elif server == 'dev':
+        from werkzeug.serving import make_server
+
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        host, port = sock.getsockname()[:2]
+        make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+    else:
+        raise SystemExit(f'Unknown LAB_SERVER {server!r} (expected gunicorn or dev)')
+
+
+def run(factory):
+    """Serve the app built by ``factory`` with the server chosen by LAB_SERVER."""
+    server = os.environ.get('LAB_SERVER', 'dev')
+    if server == 'gunicorn':
+        run_gunicorn(factory)
+    elif server == 'dev':
+        run_dev(factory)
+    else:
+        raise SystemExit(f'Unknown LAB_SERVER {server!r} (expected gunicorn or dev)')
@@ -0,0 +1,201 @@
+"""Multi-tenant hosting: one process serving many lab instances.
+
+Every tenant gets its own Flask app built by the lab's ``create_app()``
+factory, so all per-instance state (flags, issued tokens, verification
+codes, rate counters) is isolated by construction. Requests are routed by
+path prefix (``/t/<tenant>/...``) or by Host header (``<tenant>.<domain>``
+when ``LAB_TENANT_DOMAIN`` is set).
+
+Tenant lookup is a single dict access. Apps are kept in least-recently-used
+order; tenants idle for longer than ``idle_seconds`` (or beyond
+``max_tenants``) are evicted on the next request and rebuilt if they return.
+
+Building a tenant costs a full ``create_app`` and may evict another, so
+tenants are not created by whoever asks. With ``LAB_TENANT_SECRET`` set a
+tenant is only served under its signed address, ``<tenant>.<tag>``
+(``/t/alice.3f9a1c07d2e45b61/`` or ``alice.3f9a1c07d2e45b61.<domain>``),
+where the tag is the start of HMAC-SHA256(secret, tenant); the orchestrator
+hands out addresses made with ``address()``. Other names get 404. Either way
+each client IP may create at most ``LAB_TENANT_CREATE_RATE`` tenants
+(per second / burst); beyond that it gets 429 until its bucket refills.
+
+    LAB_TENANT_SECRET        key tenant addresses are signed with (default: unset = any id)
+    LAB_TENANT_CREATE_RATE   tenants built per client, rate/burst (default: 0.5/30)
+"""
+import hashlib
+import hmac
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from labkit import admission, health, metrics
+
+TENANT_PREFIX = '/t/'
+TENANT_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+TAG_LENGTH = 16
+CREATE_RATE = (0.5, 30)
+
+
+def tenant_tag(tenant, secret):
+    return hmac.new(secret.encode(), tenant.encode(), hashlib.sha256).hexdigest()[:TAG_LENGTH]
+
+
+def address(tenant, secret=None):
+    """The name ``tenant`` is served under: ``<tenant>.<tag>``, or the bare id without a secret."""
+    return f'{tenant}.{tenant_tag(tenant, secret)}' if secret else tenant
+
+
+def _json_response(start_response, status, body, headers=()):
+    payload = json.dumps(body).encode()
+    start_response(status, [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(payload))),
+        *headers,
+    ])
+    return [payload]
+
+
+class TenantDispatcher:
+    """WSGI app that routes each request to its tenant's lab app."""
+
+    def __init__(self, factory, domain=None, max_tenants=500, idle_seconds=1800, secret=None,
+                 create_rate=CREATE_RATE):
+        self.factory = factory
+        self.domain = domain.lower().lstrip('.') if domain else None
+        self.max_tenants = max_tenants
+        self.idle_seconds = idle_seconds
+        self.secret = secret
+        self.create_rate = create_rate  # (per second, burst) per client IP, or None
+        self.created = 0
+        self.evicted = 0
+        self._apps = OrderedDict()  # tenant id -> [app, last seen]
+        self._lock = threading.Lock()
+        self._creations = admission.TokenBuckets(max_clients=10000)
+
+    def _tenant_id(self, name):
+        """The tenant ``name`` addresses, or None if it is not a valid (signed) address."""
+        if self.secret:
+            tenant, _, tag = name.rpartition('.')
+            if not hmac.compare_digest(tag.encode(), tenant_tag(tenant, self.secret).encode()):
+                return None
+            name = tenant
+        return name if TENANT_ID_RE.match(name) else None
+
+    def creation_wait(self, client):
+        """0 if ``client`` may build a tenant now, else seconds until it may."""
+        if self.create_rate is None:
+            return 0
+        rate, burst = self.create_rate
+        wait = self._creations.take(client, rate, burst)
+        if wait:
+            admission.REJECTED.inc('tenant-create')
+        return wait
+
+    def _tenant_from_host(self, environ):
+        if not self.domain:
+            return None
+        host = environ.get('HTTP_HOST', '').split(':', 1)[0].lower()
+        suffix = '.' + self.domain
+        if host.endswith(suffix):
+            return host[:-len(suffix)]
+        return None
+
+    def _evict_idle(self, now):
+        # Called with the lock held; LRU order means idle tenants sit at the front
+        while self._apps:
+            _, (_, last_seen) = next(iter(self._apps.items()))
+            if len(self._apps) <= self.max_tenants and now - last_seen < self.idle_seconds:
+                break
+            self._apps.popitem(last=False)
+            self.evicted += 1
+
+    def get_app(self, tenant):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._apps.get(tenant)
+            if entry is not None:
+                entry[1] = now
+                self._apps.move_to_end(tenant)
+                return entry[0]
+
+        # Build outside the lock; if two requests race, the first insert wins
+        app = self.factory({'TENANT_ID': tenant})
+        with self._lock:
+            entry = self._apps.setdefault(tenant, [app, now])
+            if entry[0] is app:
+                self.created += 1
+            self._apps.move_to_end(tenant)
+            self._evict_idle(now)
+            return entry[0]
+
+    def stats(self):
+        return {'tenants': len(self._apps), 'created': self.created, 'evicted': self.evicted}
+
+    def __call__(self, environ, start_response):
+        tenant = self._tenant_from_host(environ)
+        path = environ.get('PATH_INFO', '')
+
+        if tenant is None and path == '/metrics':
+            # Process-wide metrics, scraped once for all tenants
+            if not metrics.scrape_allowed(environ, shared=True):
+                return _json_response(start_response, '403 Forbidden', {'error': 'Forbidden'})
+            return metrics.render_response()(environ, start_response)
+
+        if tenant is None and path in ('/healthz', '/readyz'):
+            # Tenants are built on demand, so the process is ready once the dispatcher is
+            code, body = health.liveness() if path == '/healthz' else health.status()
+            return _json_response(start_response, '200 OK' if code == 200 else '503 Service Unavailable', body)
+
+        if tenant is None and path.startswith(TENANT_PREFIX):
+            tenant, _, rest = path[len(TENANT_PREFIX):].partition('/')
+            if not rest and not path.endswith('/'):
+                # Pages use relative URLs, so the tenant root needs its trailing slash
+                location = environ.get('SCRIPT_NAME', '') + path + '/'
+                return _json_response(start_response, '308 Permanent Redirect',
+                                      {'redirect': location}, [('Location', location)])
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + TENANT_PREFIX + tenant
+            environ['PATH_INFO'] = '/' + rest
+
+        tenant = self._tenant_id(tenant) if tenant is not None else None
+        if tenant is None:
+            return _json_response(start_response, '404 Not Found',
+                                  {'error': 'Unknown lab instance'})
+
+        if tenant not in self._apps:
+            wait = self.creation_wait(environ.get('REMOTE_ADDR'))
+            if wait:
+                return _json_response(start_response, '429 Too Many Requests',
+                                      {'error': 'Too many new lab instances, slow down', 'retry_after': round(wait, 3)},
+                                      [('Retry-After', str(max(1, math.ceil(wait))))])
+
+        return self.get_app(tenant)(environ, start_response)
+
+
+def _rate(spec):
+    """``rate/burst`` as a tuple; "off" for no limit, unset for the default."""
+    if not spec:
+        return CREATE_RATE
+    if spec.strip().lower() == 'off':
+        return None
+    rate, _, burst = spec.partition('/')
+    return float(rate), float(burst or rate)
+
+
+def from_env(factory):
+    """TenantDispatcher configured from LAB_TENANT_* environment variables."""
+    dispatcher = TenantDispatcher(
+        factory,
+        domain=os.environ.get('LAB_TENANT_DOMAIN'),
+        max_tenants=int(os.environ.get('LAB_MAX_TENANTS', 500)),
+        idle_seconds=int(os.environ.get('LAB_TENANT_IDLE_SECONDS', 1800)),
+        secret=os.environ.get('LAB_TENANT_SECRET') or None,
+        create_rate=_rate(os.environ.get('LAB_TENANT_CREATE_RATE')),
+    )
+    metrics.REGISTRY.gauge('lab_tenants', 'Tenant apps created, evicted and currently resident.',
+                           lambda: [({'state': k}, v) for k, v in dispatcher.stats().items()])
+    health.mark_ready()
+    return dispatcher
@@ -0,0 +1,400 @@
+"""Preloaded launcher that forks lab instances on demand (a "zygote").
+
+    python3 -m labkit.zygote [--labs crypto,ssrf] [--control /tmp/lab-zygote.sock]
+
+The launcher loads each lab once:
+
+  * its app.py;
+  * the modules the lab only imports on first use (NumPy, requests);
+  * one throwaway instance, so templates and precompressed pages are
+    cached.
+
+It then collects and freezes the heap (``gc.freeze()``) and waits on a
+Unix control socket. Each instance is a fork of it. Until an instance
+writes to a page, that page stays shared with the launcher and with every
+other instance: Flask, Werkzeug, Jinja, requests, pycryptodome and NumPy
+exist once per host. Frozen objects are never visited by an instance's
+garbage collector, so collections do not dirty those pages either. An
+instance is serving within milliseconds: the fork, the per-instance
+create_app and the first accept.
+
+Control protocol: one JSON object per line, answered with one line:
+
+    {"op": "spawn", "lab": "crypto", "port": 0, "env": {"USER_ID": "42"}}
+      -> {"ok": true, "id": "crypto-3f9a1c07", "pid": 4242, "port": 40123, "ready_ms": 4.2}
+    {"op": "stop", "id": "crypto-3f9a1c07"}   -> {"ok": true}
+    {"op": "list"}                              -> {"ok": true, "instances": [...]}
+
+The launcher binds the instance's socket (``port`` 0 picks a free one) on
+LAB_HOST before forking. By default the answer waits until the instance
+has built its app (``"wait": false`` answers right after the fork).
+Instances inherit the launcher's environment plus ``env``, which covers
+everything read in create_app: USER_ID, LAB_FLAG_SECRET, LAB_SERVER, rate
+limits, capture, events. Settings read when a module is imported (such as
+SSRF_MAX_FETCHES and COLLISION_BIRTHDAY_*) come from the launcher's own
+environment.
+
+Services a lab needs once per host (``start_shared_services``: the SSRF
+lab's internal :8080 service and DNS responder on udp/5353) run in one
+process forked at startup, next to the instances rather than in each of
+them, so every instance reaches them on the addresses the exploits use.
+They read the launcher's environment: LAB_FLAG_SECRET must be set there,
+and a spawn that gives a different one is refused. Each instance then runs
+``start_instance_services`` (the SSRF lab installs its rebinding zone).
+
+The launcher runs no threads of its own, so forking it is safe. Stopping
+it (SIGTERM) stops every instance and the services.
+
+    LAB_ZYGOTE_SOCKET      control socket path        (default: /tmp/lab-zygote.sock)
+    LAB_ZYGOTE_LABS        labs to preload            (default: crypto,ssrf)
+"""
+import argparse
+import gc
+import importlib
+import importlib.util
+import json
+import os
+import secrets
+import select
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from labkit import health, serving
+
+LABS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTROL_SOCKET = '/tmp/lab-zygote.sock'
+LABS = ('crypto', 'ssrf')
+# Imported by the labs on first use; loaded here so instances share them
+LAZY_MODULES = {
+    'crypto': ('padding_engine', 'birthday'),
+    'ssrf': ('requests', 'requests.adapters', 'chardet', 'connections'),
+}
+# Imported by labkit.serving when an instance starts serving
+SERVER_MODULES = ('werkzeug.serving', 'gunicorn.app.base', 'gunicorn.workers.gthread')
+READY_TIMEOUT = 30
+MAX_LINE = 64 * 1024
+
+
+def _preload(names):
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError:  # optional dependency (chardet, gunicorn)
+            pass
+
+
+def load_lab(name, labs_dir=LABS_DIR):
+    """Import <lab>/app.py under its own module name (every lab's module is app.py)."""
+    directory = os.path.join(labs_dir, name)
+    if directory not in sys.path:
+        sys.path.append(directory)
+    spec = importlib.util.spec_from_file_location(f'{name}_app', os.path.join(directory, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _preload(LAZY_MODULES.get(name, ()))
+    # Built once and thrown away: fills the per-process page caches instances reuse
+    module.create_app()
+    return module
+
+
+class Instance:
+    def __init__(self, instance_id, lab, pid, sock):
+        self.id = instance_id
+        self.lab = lab
+        self.pid = pid
+        self.port = sock.getsockname()[1]
+        self.started = time.time()
+
+    def describe(self):
+        return {'id': self.id, 'lab': self.lab, 'pid': self.pid, 'port': self.port, 'started': self.started}
+
+
+class Zygote:
+    def __init__(self, labs, control_path):
+        self.labs = labs  # name -> loaded app module
+        self.control_path = control_path
+        self.instances = {}
+        self.services = {}  # lab -> pid of its shared services, None once they exited
+        self.child = None  # set in a forked instance: (module, listening socket, ready fd)
+        self._selector = selectors.DefaultSelector()
+        self._buffers = {}
+        self._stopping = False
+
+    def start_services(self):
+        """Fork a process running each lab's shared services; raises if one fails to start."""
+        for name, module in self.labs.items():
+            start = getattr(module, 'start_shared_services', None)
+            if start is None:
+                continue
+            ready_read, ready_write = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(ready_read)
+                _run_services(start, ready_write)
+            os.close(ready_write)
+            try:
+                ready, _, _ = select.select([ready_read], [], [], READY_TIMEOUT)
+                started = ready and os.read(ready_read, 1)
+            finally:
+                os.close(ready_read)
+            self.services[name] = pid
+            if not started:
+                self._shutdown_services()
+                raise RuntimeError(f'{name} shared services failed to start')
+
+    def listen(self):
+        if os.path.exists(self.control_path):
+            os.unlink(self.control_path)
+        self._control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._control.bind(self.control_path)
+        self._control.listen(16)
+        self._selector.register(self._control, selectors.EVENT_READ)
+
+    def serve_forever(self):
+        """Answer control requests; returns in a freshly forked instance, never in the launcher."""
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        while not self._stopping:
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.fileobj is self._control:
+                    conn, _ = self._control.accept()
+                    self._selector.register(conn, selectors.EVENT_READ)
+                    self._buffers[conn] = b''
+                else:
+                    self._read(key.fileobj)
+                if self.child is not None:
+                    return self.child
+            self._reap()
+        self._shutdown()
+        return None
+
+    def _stop(self, *_):
+        self._stopping = True
+
+    def _read(self, conn):
+        try:
+            data = conn.recv(MAX_LINE)
+        except OSError:
+            data = b''
+        if not data:
+            self._close(conn)
+            return
+        buffer = self._buffers[conn] + data
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            if line.strip():
+                reply = self.handle(line)
+                if self.child is not None:
+                    return
+                try:
+                    conn.sendall(json.dumps(reply).encode() + b'\n')
+                except OSError:
+                    self._close(conn)
+                    return
+        if len(buffer) > MAX_LINE:
+            self._close(conn)
+            return
+        self._buffers[conn] = buffer
+
+    def _close(self, conn):
+        self._selector.unregister(conn)
+        self._buffers.pop(conn, None)
+        conn.close()
+
+    def handle(self, line):
+        try:
+            request = json.loads(line)
+            op = request.get('op')
+            if op == 'spawn':
+                return self.spawn(request)
+            if op == 'stop':
+                return self.stop(request.get('id'))
+            if op == 'list':
+                self._reap()
+                return {'ok': True, 'instances': [i.describe() for i in self.instances.values()]}
+            return {'ok': False, 'error': f'Unknown op {op!r}'}
+        except (ValueError, TypeError, AttributeError) as e:
+            return {'ok': False, 'error': str(e)}
+        except OSError as e:
+            return {'ok': False, 'error': f'{e.strerror or e}'}
+
+    def spawn(self, request):
+        lab = request.get('lab')
+        if lab not in self.labs:
+            return {'ok': False, 'error': f'Unknown lab {lab!r} (preloaded: {", ".join(self.labs)})'}
+        env = {str(k): str(v) for k, v in (request.get('env') or {}).items()}
+        if lab in self.services:
+            if self.services[lab] is None:
+                return {'ok': False, 'error': f'The {lab} shared services exited'}
+            if env.get('LAB_FLAG_SECRET', os.environ.get('LAB_FLAG_SECRET', '')) != os.environ.get('LAB_FLAG_SECRET', ''):
+                return {'ok': False, 'error': f'The {lab} shared services use the launcher\'s LAB_FLAG_SECRET'}
+        instance_id = str(request.get('id') or f'{lab}-{secrets.token_hex(4)}')
+        if instance_id in self.instances:
+            return {'ok': False, 'error': f'Instance {instance_id!r} exists'}
+
+        host = env.get('LAB_HOST', os.environ.get('LAB_HOST', '0.0.0.0'))
+        port = int(request.get('port', env.get('LAB_PORT', 0)))
+        sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+            sock.listen(128)
+        except OSError:
+            sock.close()
+            raise
+
+        started = time.perf_counter()
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            env['LAB_HOST'], env['LAB_PORT'] = host, str(sock.getsockname()[1])
+            self._become_instance(env)
+            self.child = (self.labs[lab], sock, ready_write)
+            return None
+
+        os.close(ready_write)
+        instance = self.instances[instance_id] = Instance(instance_id, lab, pid, sock)
+        sock.close()
+        try:
+            reply = {'ok': True, **{k: v for k, v in instance.describe().items() if k != 'started'}}
+            if request.get('wait', True):
+                ready, _, _ = select.select([ready_read], [], [], READY_TIMEOUT)
+                if not ready or not os.read(ready_read, 1):
+                    self.stop(instance_id)
+                    return {'ok': False, 'error': f'Instance {instance_id} failed to start'}
+            reply['ready_ms'] = round((time.perf_counter() - started) * 1e3, 2)
+            return reply
+        finally:
+            os.close(ready_read)
+
+    def _become_instance(self, env):
+        # Runs in the forked child: drop everything that belongs to the launcher
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        for conn in list(self._buffers):
+            conn.close()
+        self._control.close()
+        self._selector.close()
+        self.instances = {}
+        self.services = {}
+        os.environ.update(env)
+        health.restart_clock()
+
+    def stop(self, instance_id):
+        instance = self.instances.get(instance_id)
+        if instance is None:
+            return {'ok': False, 'error': f'No instance {instance_id!r}'}
+        try:
+            os.kill(instance.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        return {'ok': True}
+
+    def _reap(self):
+        while self.instances or any(self.services.values()):
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            for lab, services_pid in self.services.items():
+                if services_pid == pid:
+                    self.services[lab] = None
+                    print(f'[zygote] {lab} shared services (pid {pid}) exited with status '
+                          f'{os.waitstatus_to_exitcode(status)}', file=sys.stderr, flush=True)
+            for instance_id, instance in list(self.instances.items()):
+                if instance.pid == pid:
+                    del self.instances[instance_id]
+                    print(f'[zygote] {instance_id} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}',
+                          file=sys.stderr, flush=True)
+
+    def _shutdown(self):
+        for instance in self.instances.values():
+            try:
+                os.kill(instance.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + 10
+        while self.instances and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for instance in self.instances.values():
+            try:
+                os.kill(instance.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self._shutdown_services()
+        self._control.close()
+        os.unlink(self.control_path)
+
+    def _shutdown_services(self):
+        for lab, pid in self.services.items():
+            if pid is None:
+                continue
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.services[lab] = None
+
+
+def _run_services(start, ready_fd):
+    """In the forked services process: start them, signal ready and keep their threads alive."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the launcher stops us on Ctrl-C
+    try:
+        start()
+    except BaseException:
+        traceback.print_exc()
+        os._exit(1)
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+    while True:
+        signal.pause()
+
+
+def run_instance(module, sock, ready_fd):
+    """In a forked instance: start the lab's own services, build its app, signal ready and serve."""
+    start_services = getattr(module, 'start_instance_services', None)
+    if start_services is not None:
+        start_services()
+    app = serving.application(module.create_app)
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+    serving.serve(app, sock)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--labs', default=os.environ.get('LAB_ZYGOTE_LABS', ','.join(LABS)),
+                        help='comma-separated labs to preload')
+    parser.add_argument('--labs-dir', default=LABS_DIR, help='directory holding <lab>/app.py')
+    parser.add_argument('--control', default=os.environ.get('LAB_ZYGOTE_SOCKET', CONTROL_SOCKET),
+                        help='control socket path')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    labs = {name: load_lab(name, args.labs_dir) for name in filter(None, args.labs.split(','))}
+    _preload(SERVER_MODULES)
+    # Everything loaded so far is permanent: keep the collector away from those pages
+    gc.collect()
+    gc.freeze()
+    zygote = Zygote(labs, args.control)
+    zygote.start_services()
+    zygote.listen()
+    print(f'[zygote] {", ".join(labs)} preloaded in {time.perf_counter() - started:.2f}s '
+          f'({gc.get_freeze_count()} objects frozen), control socket {args.control}', file=sys.stderr, flush=True)
+
+    child = zygote.serve_forever()
+    if child is not None:
+        run_instance(*child)
+
+
+if __name__ == '__main__':
+    main()
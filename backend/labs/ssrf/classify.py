@@ -0,0 +1,239 @@
+"""URL classification shared by the SSRF levels.
+
+A ``Target`` parses the submitted URL once. Its host is resolved on first
+use through ``DNS``, a small TTL cache in front of the system resolver that
+the rebinding responder (dns_responder.py) plugs into as a source. The
+fetches connect through it as well (connections.py), so a URL's host is
+looked up once per TTL rather than once per check and again per fetch,
+and a name the responder rebinds changes between the two. Each
+resolved address is matched against precompiled CIDR tables (loopback,
+link-local, private, metadata, ...) with a binary search over a flattened
+range index.
+
+What a level actually blocks is data: ``POLICIES`` lists each level's
+(deliberately weak) checks, evaluated in order against the Target. The
+substring checks (``Contains``) never resolve anything; a level opts into
+resolving with ``ResolvesInto``.
+
+    SSRF_DNS_TTL           seconds a system-resolver answer is reused (default: 30)
+                           (names from dns_responder carry their own TTLs)
+    SSRF_DNS_CACHE_SIZE    host names kept                           (default: 4096)
+"""
+import ipaddress
+import os
+import socket
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from labkit import metrics
+
+DNS_TTL = float(os.environ.get('SSRF_DNS_TTL', 30))
+DNS_CACHE_SIZE = int(os.environ.get('SSRF_DNS_CACHE_SIZE', 4096))
+
+RANGES = {
+    'unspecified': ('0.0.0.0/8', '::/128'),
+    'loopback': ('127.0.0.0/8', '::1/128'),
+    'private': ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', 'fc00::/7'),
+    'shared': ('100.64.0.0/10',),
+    'link-local': ('169.254.0.0/16', 'fe80::/10'),
+    'metadata': ('169.254.169.254/32', '169.254.170.2/32', 'fd00:ec2::254/128'),
+}
+
+DNS_LOOKUPS = metrics.REGISTRY.counter(
+    'lab_ssrf_dns_lookups_total', 'Host name lookups by the SSRF resolver cache.', ('result',))
+
+
+class RangeIndex:
+    """Address -> frozenset of range names, by binary search.
+
+    Overlapping networks are flattened at build time into disjoint
+    intervals, each carrying every name that covers it.
+    """
+
+    def __init__(self, ranges):
+        self._tables = {}
+        for version in (4, 6):
+            networks = [(ipaddress.ip_network(cidr), name)
+                        for name, cidrs in ranges.items() for cidr in cidrs]
+            networks = [(int(n.network_address), int(n.broadcast_address) + 1, name)
+                        for n, name in networks if n.version == version]
+            bounds = sorted({0} | {b for start, end, _ in networks for b in (start, end)})
+            starts, names = [], []
+            for start in bounds:
+                starts.append(start)
+                names.append(frozenset(name for s, e, name in networks if s <= start < e))
+            self._tables[version] = (starts, names)
+
+    def lookup(self, address):
+        if ':' in address:
+            value, version = int.from_bytes(socket.inet_pton(socket.AF_INET6, address.split('%')[0]), 'big'), 6
+            if value >> 32 == 0xffff:  # IPv4-mapped
+                value, version = value & 0xffffffff, 4
+        else:
+            value, version = int.from_bytes(socket.inet_pton(socket.AF_INET, address), 'big'), 4
+        starts, names = self._tables[version]
+        return names[bisect_right(starts, value) - 1]
+
+
+INDEX = RangeIndex(RANGES)
+
+
+class DNSCache:
+    """getaddrinfo answers reused for ``ttl`` seconds, least recently used evicted.
+
+    ``sources`` are asked before the system resolver: callables returning
+    ``(addresses, ttl)`` for names they serve and None otherwise. Their TTLs
+    are used as given, so 0 means every lookup asks again.
+    """
+
+    def __init__(self, ttl=DNS_TTL, max_entries=DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sources = []
+        self._entries = OrderedDict()  # host -> (expires, [(family, address)])
+        self._lock = threading.Lock()
+
+    def cached(self, host):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None or entry[0] <= now:
+                return None
+            self._entries.move_to_end(host)
+        DNS_LOOKUPS.inc('hit')
+        return entry[1]
+
+    def resolve(self, host):
+        """[(family, address)] for ``host``; raises socket.gaierror like getaddrinfo."""
+        addresses = self.cached(host)
+        if addresses is not None:
+            return addresses
+        DNS_LOOKUPS.inc('miss')
+
+        for source in self.sources:
+            answer = source(host)
+            if answer is not None:
+                addresses = [(socket.AF_INET6 if ':' in a else socket.AF_INET, a) for a in answer[0]]
+                ttl = answer[1]
+                break
+        else:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+            addresses = list(dict.fromkeys((family, sockaddr[0]) for family, _, _, _, sockaddr in infos))
+            ttl = self.ttl
+
+        if ttl > 0:
+            with self._lock:
+                self._entries[host] = (time.monotonic() + ttl, addresses)
+                self._entries.move_to_end(host)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return addresses
+
+
+DNS = DNSCache()
+
+
+class Target:
+    """A submitted URL, parsed once; resolution happens on first use."""
+
+    def __init__(self, url):
+        self.url = url
+        self.lowered = url.lower()
+        try:
+            self.parts = urlsplit(url.strip())
+            self.host = self.parts.hostname
+        except ValueError:
+            self.parts, self.host = None, None
+        self._addresses = None
+
+    def addresses(self):
+        """Resolved addresses of the host ([] if it does not resolve)."""
+        if self._addresses is None:
+            self._addresses = []
+            if self.host:
+                try:
+                    self._addresses = [address for _, address in resolve(self.host)]
+                except (OSError, UnicodeError):
+                    pass
+        return self._addresses
+
+    def ranges(self):
+        """Names of every range any resolved address falls in."""
+        names = set()
+        for address in self.addresses():
+            names |= INDEX.lookup(address)
+        return names
+
+
+def _canonical_host(host):
+    # Legacy numeric forms (127.1, 2130706433) resolve like getaddrinfo would
+    try:
+        return socket.inet_ntoa(socket.inet_aton(host))
+    except OSError:
+        return host
+
+
+def resolve(host):
+    """[(family, address)] for ``host`` through ``DNS``; what the checks and the fetches both use."""
+    return DNS.resolve(_canonical_host(host))
+
+
+# Checks: (target) -> bool
+
+@dataclass(frozen=True)
+class Contains:
+    """The raw URL contains ``text`` (a substring test, trivially bypassed)."""
+    text: str
+    ignore_case: bool = False
+
+    def __call__(self, target):
+        if self.ignore_case:
+            return self.text.lower() in target.lowered
+        return self.text in target.url
+
+
+@dataclass(frozen=True)
+class ResolvesInto:
+    """Any resolved address of the host is in one of the named ranges."""
+    names: tuple
+
+    def __call__(self, target):
+        return bool(target.ranges() & set(self.names))
+
+
+@dataclass(frozen=True)
+class Policy:
+    blocked: tuple = ()            # checks that reject the URL
+    message: str = 'Blocked'
+    simulate_metadata: tuple = ()  # checks that answer with the simulated metadata instead
+
+    def blocks(self, target):
+        return any(check(target) for check in self.blocked)
+
+    def simulates_metadata(self, target):
+        return any(check(target) for check in self.simulate_metadata)
+
+
+# The levels are meant to be bypassed: these are the exact checks they have always made
+POLICIES = {
+    'easy': Policy(),
+    'medium': Policy(
+        blocked=(Contains('localhost', ignore_case=True), Contains('127.0.0.1')),
+        message='Access to localhost is blocked!',
+    ),
+    'hard': Policy(
+        blocked=(Contains('localhost', ignore_case=True), Contains('127.0.0')),
+        message='Localhost blocked',
+        simulate_metadata=(Contains('169.254.169.254'),),
+    ),
+    # Resolves the host and checks the addresses, then fetches later on a job worker,
+    # which resolves again: the gap DNS rebinding slips through
+    'impossible': Policy(
+        blocked=(ResolvesInto(('unspecified', 'loopback', 'private', 'shared', 'link-local')),),
+        message='Internal addresses are blocked',
+    ),
+}
@@ -0,0 +1,93 @@
+"""urllib3 connections for the SSRF fetches that resolve through classify.DNS.
+
+urllib3 hands host names to getaddrinfo, which never sees the rebinding
+responder's zone. These connections ask ``classify.resolve`` instead, once
+per new connection, and try each address in turn, so a rebinding name can
+answer one thing when a level checks it and another when the fetch
+connects. Errors are urllib3's own, with the same messages.
+
+The internal service's owner header (internal_service.OWNER_HEADER) is
+only sent on a connection whose peer is that service; on every other
+connection, redirects included, it is dropped before the request goes out.
+
+``install(adapter)`` makes a ``requests`` adapter's pools use them.
+"""
+import socket
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util import connection
+
+import classify
+import internal_service
+
+_OWNER_HEADER = internal_service.OWNER_HEADER.lower()
+
+
+class _Resolving:
+    def _new_conn(self):
+        try:
+            addresses = classify.resolve(self._dns_host)
+        except (socket.gaierror, UnicodeError) as e:
+            raise NameResolutionError(self.host, self, e) from e
+
+        error = socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        for _, address in addresses:
+            try:
+                return connection.create_connection(
+                    (address, self.port),
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except OSError as e:
+                error = e
+        if isinstance(error, socket.timeout):
+            raise ConnectTimeoutError(
+                self, f'Connection to {self.host} timed out. (connect timeout={self.timeout})') from error
+        if isinstance(error, socket.gaierror):
+            raise NameResolutionError(self.host, self, error) from error
+        raise NewConnectionError(self, f'Failed to establish a new connection: {error}') from error
+
+    def request(self, method, url, body=None, headers=None, **kwargs):
+        if headers and any(k.lower() == _OWNER_HEADER for k in headers):
+            # Connect first: the peer decides whether the header may go out
+            if self.sock is None:
+                self.connect()
+            if not internal_service.serves(self.sock.getpeername()):
+                headers = {k: v for k, v in headers.items() if k.lower() != _OWNER_HEADER}
+        return super().request(method, url, body, headers, **kwargs)
+
+
+class ResolvingHTTPConnection(_Resolving, HTTPConnection):
+    pass
+
+
+class ResolvingHTTPSConnection(_Resolving, HTTPSConnection):
+    pass
+
+
+class ResolvingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = ResolvingHTTPConnection
+
+
+class ResolvingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = ResolvingHTTPSConnection
+
+
+POOL_CLASSES = {'http': ResolvingHTTPConnectionPool, 'https': ResolvingHTTPSConnectionPool}
+
+
+def install(adapter):
+    """Use the resolving connections for ``adapter``'s fetches, direct or through a proxy."""
+    adapter.poolmanager.pool_classes_by_scheme = POOL_CLASSES
+    proxy_manager_for = adapter.proxy_manager_for
+
+    def resolving_proxy_manager_for(proxy, **kwargs):
+        manager = proxy_manager_for(proxy, **kwargs)
+        manager.pool_classes_by_scheme = POOL_CLASSES
+        return manager
+
+    adapter.proxy_manager_for = resolving_proxy_manager_for
+    return adapter
@@ -0,0 +1,231 @@
+"""Programmable DNS for the rebinding level, answered in-process.
+
+A ``Zone`` owns every name under one suffix (``rebind.lab`` by default)
+and hands out answers that change over time, which is what DNS rebinding
+needs, with no external network:
+
+- rbndr-style names: ``7f000001.5db8d822.rebind.lab`` alternates between
+  127.0.0.1 and 93.184.216.34 on every lookup (first address first).
+- Records from SSRF_DNS_RECORDS (a JSON file) give a name a sequence of
+  answers, each served for its own TTL before the next one; the last step
+  repeats. TTLs may be sub-second, e.g. a public address for 0.2s, then
+  127.0.0.1:
+
+      {"safe.rebind.lab": [{"addresses": ["93.184.216.34"], "ttl": 0.2},
+                           {"addresses": ["127.0.0.1"], "ttl": 60}]}
+
+The lab's resolver (``classify.DNS``) asks the zone directly, so the float
+TTLs are honoured exactly. The same zone is served over UDP on
+SSRF_DNS_BIND:SSRF_DNS_PORT for tools like ``dig`` (TTLs are rounded down
+to whole seconds on the wire). Per-name state is kept in a bounded LRU.
+
+``start`` does both. Instances forked from the zygote only ``install`` the
+zone: the UDP port is served once per host by the launcher's services.
+
+    SSRF_DNS_RESPONDER     1 to enable                 (default: off)
+    SSRF_DNS_SUFFIX        zone served                 (default: rebind.lab)
+    SSRF_DNS_RECORDS       JSON file of record sequences
+    SSRF_DNS_BIND          UDP address                 (default: 127.0.0.1)
+    SSRF_DNS_PORT          UDP port                    (default: 5353)
+"""
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import classify
+
+MAX_NAMES = 10000
+REBIND_TTL = 0  # rbndr names are never cached, so every lookup flips
+
+TYPE_A, TYPE_AAAA, CLASS_IN = 1, 28, 1
+RCODE_NXDOMAIN, RCODE_REFUSED, RCODE_FORMERR = 3, 5, 1
+
+_started = None
+_installed = None
+_start_lock = threading.Lock()
+
+
+class Zone:
+    def __init__(self, suffix='rebind.lab', records=None, max_names=MAX_NAMES):
+        self.suffix = '.' + suffix.lower().strip('.')
+        self.max_names = max_names
+        # name -> [(addresses, ttl), ...]
+        self.records = {name.lower().rstrip('.'): [(tuple(step['addresses']), float(step['ttl'])) for step in steps]
+                        for name, steps in (records or {}).items()}
+        self._state = OrderedDict()  # name -> [step index, step started]
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name.endswith(self.suffix) or name == self.suffix[1:]
+
+    def _rebind_steps(self, name):
+        labels = name[:-len(self.suffix)].split('.')
+        if len(labels) != 2 or not all(len(label) == 8 for label in labels):
+            return None
+        try:
+            return [((socket.inet_ntoa(bytes.fromhex(label)),), REBIND_TTL) for label in labels]
+        except ValueError:
+            return None
+
+    def _step(self, name, steps, cycle):
+        # Called with the lock held
+        now = time.monotonic()
+        state = self._state.get(name)
+        if state is None:
+            state = self._state[name] = [0, now]
+            while len(self._state) > self.max_names:
+                self._state.popitem(last=False)
+        else:
+            self._state.move_to_end(name)
+            index, started = state
+            if cycle:
+                state[0] = (index + 1) % len(steps)
+            elif now - started >= steps[index][1] and index + 1 < len(steps):
+                # A step lasts its TTL from when it was first served
+                state[:] = [index + 1, now]
+        return steps[state[0]]
+
+    def answer(self, name):
+        """(addresses, ttl) for ``name``; None outside the zone.
+
+        Raises socket.gaierror for names in the zone it has no answer for.
+        """
+        name = name.lower().rstrip('.')
+        if name not in self:
+            return None
+        steps, cycle = self.records.get(name), False
+        if steps is None:
+            steps, cycle = self._rebind_steps(name), True
+        if not steps:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        with self._lock:
+            return self._step(name, steps, cycle)
+
+
+def _parse_question(packet):
+    """(id, flags, qname, qtype, end of question) of a DNS query."""
+    query_id, flags, qdcount = struct.unpack_from('!HHH', packet)
+    if flags & 0x8000 or qdcount != 1:
+        raise ValueError('not a single-question query')
+    labels, offset = [], 12
+    while True:
+        length = packet[offset]
+        offset += 1
+        if length == 0:
+            break
+        if length & 0xc0:
+            raise ValueError('compressed question')
+        labels.append(packet[offset:offset + length].decode('ascii'))
+        offset += length
+    qtype, _ = struct.unpack_from('!HH', packet, offset)
+    return query_id, flags, '.'.join(labels), qtype, offset + 4
+
+
+def _response(query_id, flags, question, rcode, records=()):
+    # QR and AA set, RD copied from the query, no recursion available
+    header = struct.pack('!HHHHHH', query_id, 0x8400 | (flags & 0x0100) | rcode,
+                         1 if question else 0, len(records), 0, 0)
+    return b''.join((header, question, *records))
+
+
+def build_reply(zone, packet):
+    """Wire-format reply to a DNS query ``packet``, or None to drop it."""
+    try:
+        query_id, flags, name, qtype, end = _parse_question(packet)
+    except (ValueError, IndexError, struct.error, UnicodeDecodeError):
+        if len(packet) < 2:
+            return None
+        return _response(struct.unpack_from('!H', packet)[0], 0, b'', RCODE_FORMERR)
+
+    question = packet[12:end]
+    try:
+        answer = zone.answer(name)
+    except socket.gaierror:
+        return _response(query_id, flags, question, RCODE_NXDOMAIN)
+    if answer is None:
+        return _response(query_id, flags, question, RCODE_REFUSED)
+
+    addresses, ttl = answer
+    records = []
+    for address in addresses:
+        family = socket.AF_INET6 if ':' in address else socket.AF_INET
+        rtype = TYPE_AAAA if family == socket.AF_INET6 else TYPE_A
+        if rtype == qtype:
+            rdata = socket.inet_pton(family, address)
+            # 0xc00c points back at the name in the question
+            records.append(struct.pack('!HHHIH', 0xc00c, rtype, CLASS_IN, int(ttl), len(rdata)) + rdata)
+    return _response(query_id, flags, question, 0, records)
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, zone):
+        self.zone = zone
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        reply = build_reply(self.zone, data)
+        if reply is not None:
+            self.transport.sendto(reply, addr)
+
+
+def serve(zone, host='127.0.0.1', port=5353):
+    """Answer ``zone`` over UDP from a daemon thread; returns the bound (host, port)."""
+    loop = asyncio.new_event_loop()
+    transport, _ = loop.run_until_complete(
+        loop.create_datagram_endpoint(lambda: _Protocol(zone), local_addr=(host, port)))
+    threading.Thread(target=loop.run_forever, name='ssrf-dns', daemon=True).start()
+    return transport.get_extra_info('sockname')[:2]
+
+
+def install(zone):
+    """Make the lab's resolver answer from ``zone``, once per process. Returns the zone in use."""
+    global _installed
+    with _start_lock:
+        if _installed is None or _installed[0] != os.getpid():
+            classify.DNS.sources.append(zone.answer)
+            _installed = (os.getpid(), zone)
+        return _installed[1]
+
+
+def start(zone, host='127.0.0.1', port=5353):
+    """Serve ``zone`` and make the lab's resolver use it, once per process."""
+    global _started
+    with _start_lock:
+        if _started is None or _started[0] != os.getpid():
+            _started = (os.getpid(), zone, serve(zone, host, port))
+        zone, address = _started[1], _started[2]
+    return install(zone), address
+
+
+def running():
+    return _installed is not None
+
+
+def zone_from_env():
+    if os.environ.get('SSRF_DNS_RESPONDER', '0') != '1':
+        return None
+    records = None
+    if os.environ.get('SSRF_DNS_RECORDS'):
+        with open(os.environ['SSRF_DNS_RECORDS']) as f:
+            records = json.load(f)
+    return Zone(os.environ.get('SSRF_DNS_SUFFIX', 'rebind.lab'), records)
+
+
+def start_from_env():
+    zone = zone_from_env()
+    if zone is None:
+        return None
+    return start(zone, os.environ.get('SSRF_DNS_BIND', '127.0.0.1'), int(os.environ.get('SSRF_DNS_PORT', 5353)))
+
+
+def install_from_env():
+    zone = zone_from_env()
+    return install(zone) if zone is not None else None
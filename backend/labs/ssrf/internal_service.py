@@ -0,0 +1,267 @@
+"""The lab's "internal" file service on :8080, served from memory.
+
+This replaces ``python3 -m http.server 8080 --directory /app/internal``.
+The directory is read once at startup and every response (status line and
+headers except Date, then the body) is prebuilt, so a request is a dict
+lookup plus one scatter/gather ``sendmsg`` of the header and the body
+buffer: no stat, open or read, and no copy of the file into a new buffer.
+
+It runs as a thread in the lab process (one interpreter per container),
+accepts connections concurrently and keeps them alive, so the pooled SSRF
+fetches reuse them. URLs, listings, redirects and errors match
+SimpleHTTPRequestHandler, so the exploits work unchanged.
+
+Files carry the flags of the instance they are fetched for. One service can
+serve several instances (the tenants of a multi-tenant process, the forks
+of a zygote): the lab's fetcher names the instance's owner in the
+X-Lab-Owner header, and ``Contents`` keeps prebuilt entries per owner,
+substituted in memory from the files read at startup. The header carries
+an HMAC of the owner under OWNER_KEY, a random key made when this module
+is imported, so only processes forked from the one that imported it (the
+lab's workers, tenants and zygote instances) can name an owner; anything
+else gets the process's own (USER_ID) files. The fetcher only sends the
+header on connections to this service (connections.py).
+Instances forked from the zygote do not start one: they ``attach`` to the
+service the launcher runs for the whole host.
+
+    SSRF_INTERNAL_DIR      directory to serve; unset disables the service
+    SSRF_INTERNAL_BIND     address to listen on       (default: 127.0.0.1)
+    SSRF_INTERNAL_PORT     port to listen on          (default: 8080)
+"""
+import email.utils
+import hashlib
+import hmac
+import html
+import ipaddress
+import mimetypes
+import os
+import secrets
+import sys
+import threading
+import urllib.parse
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+OWNER_HEADER = 'X-Lab-Owner'
+OWNER_KEY = secrets.token_bytes(32)
+MAX_OWNERS = 1000
+
+_started = None
+_attached = False
+_start_lock = threading.Lock()
+
+
+def _listing(path, url_path):
+    """Directory page in SimpleHTTPRequestHandler's format."""
+    enc = sys.getfilesystemencoding()
+    title = f'Directory listing for {html.escape(url_path, quote=False)}'
+    r = ['<!DOCTYPE HTML>', '<html lang="en">', '<head>', f'<meta charset="{enc}">',
+         f'<title>{title}</title>\n</head>', f'<body>\n<h1>{title}</h1>', '<hr>\n<ul>']
+    for name in sorted(os.listdir(path), key=str.lower):
+        fullname = os.path.join(path, name)
+        displayname = linkname = name
+        if os.path.isdir(fullname):
+            displayname = linkname = name + '/'
+        if os.path.islink(fullname):
+            displayname = name + '@'
+        r.append('<li><a href="%s">%s</a></li>' % (
+            urllib.parse.quote(linkname, errors='surrogatepass'), html.escape(displayname, quote=False)))
+    r.append('</ul>\n<hr>\n</body>\n</html>\n')
+    return '\n'.join(r).encode(enc, 'surrogateescape'), f'text/html; charset={enc}', None
+
+
+def _headers(content_type, length, mtime):
+    lines = [f'Content-type: {content_type}', f'Content-Length: {length}']
+    if mtime is not None:
+        lines.append(f'Last-Modified: {email.utils.formatdate(mtime, usegmt=True)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def _scan(root):
+    """Path -> (body, content type, mtime, is a file) for everything ``load_directory`` serves."""
+    records = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        files = {}
+        for name in filenames:
+            fullname = os.path.join(dirpath, name)
+            with open(fullname, 'rb') as f:
+                body = f.read()
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            files[name] = records[fullname] = (body, content_type, int(os.path.getmtime(fullname)), True)
+        url_path = '/' + os.path.relpath(dirpath, root).replace(os.sep, '/').lstrip('.')
+        url_path = url_path.rstrip('/') + '/'
+        index = files.get('index.html') or files.get('index.htm') or (*_listing(dirpath, url_path), False)
+        records[dirpath.rstrip('/') + '/'] = index
+    return records
+
+
+def _entries(records, substitute=None):
+    entries = {}
+    for path, (body, content_type, mtime, is_file) in records.items():
+        if is_file and substitute is not None:
+            body = substitute(body)
+        entries[path] = (_headers(content_type, len(body), mtime), body)
+    return entries
+
+
+def load_directory(root, substitute=None):
+    """Map each filesystem path under ``root`` to (headers, body).
+
+    Keys are what ``translate_path`` returns: files by path, directories by
+    path with a trailing slash (their index.html or a listing). File bodies
+    go through ``substitute(bytes)`` if given (the instance's flags).
+    """
+    root = os.path.abspath(root)
+    return root, _entries(_scan(root), substitute)
+
+
+def owner_header(owner):
+    """The OWNER_HEADER value naming ``owner``: the owner and its HMAC under OWNER_KEY."""
+    return f'{owner}:{hmac.new(OWNER_KEY, str(owner).encode(), hashlib.sha256).hexdigest()}'
+
+
+def _owner(value):
+    """The owner an OWNER_HEADER value names, or None if it is missing or forged."""
+    if not value:
+        return None
+    owner, _, tag = value.rpartition(':')
+    expected = hmac.new(OWNER_KEY, owner.encode(), hashlib.sha256).hexdigest()
+    return owner if hmac.compare_digest(tag.encode(), expected.encode()) else None
+
+
+class Contents:
+    """Entries of ``root`` per instance owner, built on first use.
+
+    The directory is read once; ``substitute_for(owner)`` returns the
+    owner's body substitution (its flags), applied in memory. Without it
+    every owner gets the files as they are. The least recently used owners
+    are dropped beyond ``max_owners``.
+    """
+
+    def __init__(self, root, substitute_for=None, default_owner='', max_owners=MAX_OWNERS):
+        self.substitute_for = substitute_for
+        self.default_owner = default_owner
+        self.max_owners = max_owners
+        self._entries = OrderedDict()  # owner -> entries
+        self._lock = threading.Lock()
+        self.root = os.path.abspath(root)
+        self._records = _scan(self.root)
+        self._default = _entries(self._records, substitute_for(default_owner) if substitute_for else None)
+
+    def entries(self, owner=None):
+        if owner is None or self.substitute_for is None or owner == self.default_owner:
+            return self._default
+        with self._lock:
+            entries = self._entries.get(owner)
+            if entries is not None:
+                self._entries.move_to_end(owner)
+                return entries
+        entries = _entries(self._records, self.substitute_for(owner))
+        with self._lock:
+            self._entries[owner] = entries
+            while len(self._entries) > self.max_owners:
+                self._entries.popitem(last=False)
+        return entries
+
+
+def _sendall(sock, buffers):
+    views = [memoryview(b) for b in buffers if b]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if views and sent:
+            views[0] = views[0][sent:]
+
+
+class InternalHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = 30  # idle keep-alive connections give their thread back
+
+    def __init__(self, *args, contents, **kwargs):
+        self.contents = contents
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        self._respond(with_body=True)
+
+    def do_HEAD(self):
+        self._respond(with_body=False)
+
+    def _respond(self, with_body):
+        path = self.translate_path(self.path)
+        entries = self.contents.entries(_owner(self.headers.get(OWNER_HEADER)))
+        entry = entries.get(path)
+        if entry is None and path + '/' in entries:
+            # Directories need the trailing slash, as in SimpleHTTPRequestHandler
+            parts = urllib.parse.urlsplit(self.path)
+            location = urllib.parse.urlunsplit((parts[0], parts[1], parts[2] + '/', parts[3], parts[4]))
+            self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if entry is None:
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return
+
+        headers, body = entry
+        status = (f'{self.protocol_version} 200 OK\r\n'
+                  f'Server: {self.version_string()}\r\n'
+                  f'Date: {self.date_time_string()}\r\n').encode('latin-1')
+        _sendall(self.connection, (status, headers, body if with_body else b''))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(directory, host='127.0.0.1', port=8080, substitute_for=None, default_owner=''):
+    """Serve ``directory`` in a daemon thread, once per process. Returns the server.
+
+    Call it before ``serving.run``: under gunicorn the service then lives in
+    the master, and workers forked later do not try to bind the port again.
+    """
+    global _started
+    with _start_lock:
+        if _started is not None and _started[0] == os.getpid():
+            return _started[1]
+        contents = Contents(directory, substitute_for, default_owner)
+        server = ThreadingHTTPServer((host, port), partial(InternalHandler, contents=contents, directory=contents.root))
+        threading.Thread(target=server.serve_forever, name='ssrf-internal-service', daemon=True).start()
+        _started = (os.getpid(), server)
+        return server
+
+
+def attach():
+    """Rely on a service another process runs on this host (zygote instances)."""
+    global _attached
+    _attached = True
+
+
+def running():
+    return _started is not None or _attached
+
+
+def serves(peer):
+    """Whether a connection to ``peer`` (address, port) reaches this host's service."""
+    ports = {int(os.environ.get('SSRF_INTERNAL_PORT', 8080))}
+    if _started is not None:
+        ports.add(_started[1].server_port)
+    if peer[1] not in ports:
+        return False
+    try:
+        address = ipaddress.ip_address(peer[0].split('%')[0])
+    except ValueError:
+        return False
+    return (getattr(address, 'ipv4_mapped', None) or address).is_loopback
+
+
+def start_from_env(substitute_for=None, default_owner=''):
+    directory = os.environ.get('SSRF_INTERNAL_DIR')
+    if not directory:
+        return None
+    return start(directory, os.environ.get('SSRF_INTERNAL_BIND', '127.0.0.1'),
+                 int(os.environ.get('SSRF_INTERNAL_PORT', 8080)), substitute_for, default_owner)
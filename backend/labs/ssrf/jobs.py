@@ -0,0 +1,122 @@
+"""Background queue for the blind (IMPOSSIBLE level) fetches.
+
+The endpoint only enqueues the fetch and answers at once with a job id; a
+fixed pool of worker threads drains the queue. The queue is bounded: when
+SSRF_JOB_QUEUE fetches are already waiting, new ones are refused with
+``outbound.Busy`` instead of piling up in memory.
+
+What a student can observe of a blind fetch - when it ran, how long it
+took and whether it failed - is kept per client in a ring buffer of the
+last SSRF_JOB_HISTORY records, which they poll. Response bodies are never
+recorded.
+
+Workers fetch under their own limit rather than outbound.FETCHES, which
+guards the request threads: a client may have a quarter of the workers
+fetching for it; its other jobs are marked rejected when their turn comes.
+
+    SSRF_JOB_WORKERS       worker threads             (default: 32)
+    SSRF_JOB_QUEUE         fetches waiting at most    (default: 1024)
+    SSRF_JOB_HISTORY       records kept per client    (default: 50)
+"""
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+import outbound
+from labkit import admission, metrics
+
+WORKERS = int(os.environ.get('SSRF_JOB_WORKERS', 32))
+MAX_PENDING = int(os.environ.get('SSRF_JOB_QUEUE', 1024))
+HISTORY = int(os.environ.get('SSRF_JOB_HISTORY', 50))
+MAX_CLIENTS = 1000
+
+JOBS = metrics.REGISTRY.counter(
+    'lab_ssrf_jobs_total', 'Blind fetch jobs by outcome (queued, ok, error, rejected).', ('outcome',))
+
+
+class JobLog:
+    """Per-client ring buffers of job records for one lab instance."""
+
+    def __init__(self, history=HISTORY, max_clients=MAX_CLIENTS):
+        self.history = history
+        self.max_clients = max_clients
+        self._records = OrderedDict()  # client -> deque of records, oldest client first
+        self._lock = threading.Lock()
+
+    def add(self, client, record):
+        with self._lock:
+            records = self._records.get(client)
+            if records is None:
+                records = self._records[client] = deque(maxlen=self.history)
+                while len(self._records) > self.max_clients:
+                    self._records.popitem(last=False)
+            else:
+                self._records.move_to_end(client)
+            records.append(record)
+
+    def records(self, client):
+        """The client's records, newest first."""
+        with self._lock:
+            records = list(self._records.get(client, ()))
+        return [dict(record) for record in reversed(records)]
+
+
+class JobQueue:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        self.workers = workers
+        self.slots = admission.Concurrency('ssrf-job', workers, max(1, workers // 4))
+        self._queue = queue.Queue(max_pending)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        # Started on first use in each process, so a forking server gets its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                for i in range(self.workers):
+                    threading.Thread(target=self._work, name=f'ssrf-job-{i}', daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, log, client, url, level, owner=None):
+        """Queue a fetch of ``url`` and return its record; raises ``outbound.Busy`` if full."""
+        self._ensure_workers()
+        record = {'id': secrets.token_hex(8), 'url': url[:500], 'status': 'queued',
+                  'queued_at': time.time(), 'started_at': None, 'duration_ms': None}
+        try:
+            self._queue.put_nowait((record, client, url, level, owner))
+        except queue.Full:
+            JOBS.inc('rejected')
+            raise outbound.Busy('Too many requests queued, try again shortly')
+        JOBS.inc('queued')
+        log.add(client, record)
+        return record
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            record, client, url, level, owner = self._queue.get()
+            record['started_at'] = time.time()
+            record['status'] = 'running'
+            started = time.perf_counter()
+            try:
+                outbound.fetch_text(url, level, client, self.slots, owner)
+                outcome = 'ok'
+            except outbound.Busy:
+                outcome = 'rejected'
+            except Exception:
+                outcome = 'error'
+            record['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            record['status'] = {'ok': 'done', 'error': 'failed', 'rejected': 'rejected'}[outcome]
+            JOBS.inc(outcome)
+
+
+QUEUE = JobQueue()
+metrics.REGISTRY.gauge('lab_ssrf_jobs_pending', 'Blind fetch jobs waiting for a worker.',
+                       lambda: [({}, QUEUE.pending())])
@@ -0,0 +1,228 @@
+"""Outbound HTTP for the SSRF levels.
+
+All fetches share one pooled ``HTTPAdapter``, so repeated requests to the
+same host (mostly the internal :8080 service) reuse kept-alive connections
+instead of opening a new pool and TCP connection per call. New connections
+resolve their host through classify.DNS (connections.py), which includes
+the rebinding responder's zone. Each thread
+gets its own ``requests.Session`` mounted on that adapter. Sessions never
+store cookies, so nothing leaks between fetches, just as with a fresh
+``requests.get()``.
+
+Redirects, proxies from the environment, headers and error messages are
+the ``requests`` defaults, so every level stays exactly as exploitable as
+before.
+
+Bodies are streamed: reading stops once enough bytes are held to fill the
+5000 characters a level shows, and only those bytes are decoded, so a large
+file or an endless stream costs at most MAX_CONTENT_BYTES of memory. The
+whole fetch is also bounded by a wall-clock deadline, checked between
+chunks, on top of the per-socket timeouts.
+
+The fetch runs in the calling thread, so a fetch made for a request holds
+a server thread until it ends. At most SSRF_MAX_FETCHES such fetches run at
+once (half of LAB_THREADS by default, so the other half keeps serving
+pages, probes and verifications), and at most SSRF_MAX_FETCHES_PER_CLIENT
+per client; more are refused at once with ``Busy`` rather than queued,
+since waiting would hold the thread as well.
+Blind fetches run on the job workers (jobs.py) under their own limits.
+
+``requests`` is imported on the first fetch, not at startup, so a lab
+that is never attacked never pays for it.
+
+    SSRF_CONNECT_TIMEOUT   seconds to establish a connection (default: 5)
+    SSRF_READ_TIMEOUT      seconds between received bytes   (default: 5)
+    SSRF_FETCH_DEADLINE    seconds for the whole body       (default: 10)
+    SSRF_POOL_HOSTS        hosts with a kept-alive pool     (default: 32)
+    SSRF_POOL_PER_HOST     connections per host             (default: LAB_THREADS + SSRF_JOB_WORKERS)
+    SSRF_MAX_FETCHES       fetches in request threads       (default: LAB_THREADS / 2)
+    SSRF_MAX_FETCHES_PER_CLIENT  of those per client        (default: SSRF_MAX_FETCHES / 4)
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+
+import internal_service
+import response_cache
+from labkit import admission, metrics
+
+CONNECT_TIMEOUT = float(os.environ.get('SSRF_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('SSRF_READ_TIMEOUT', 5))
+FETCH_DEADLINE = float(os.environ.get('SSRF_FETCH_DEADLINE', 10))
+MAX_FETCHES = int(os.environ.get('SSRF_MAX_FETCHES', max(1, int(os.environ.get('LAB_THREADS', 8)) // 2)))
+MAX_FETCHES_PER_CLIENT = int(os.environ.get('SSRF_MAX_FETCHES_PER_CLIENT', max(1, MAX_FETCHES // 4)))
+
+MAX_CONTENT_CHARS = 5000
+# No encoding requests can pick uses more than 4 bytes per character
+MAX_CONTENT_BYTES = 4 * MAX_CONTENT_CHARS
+CHUNK_SIZE = 8192
+
+_adapter = None
+_adapter_lock = threading.Lock()
+_local = threading.local()
+
+# Fetches made in request threads; the blind-job workers pass their own
+FETCHES = admission.Concurrency('ssrf-fetch', MAX_FETCHES, MAX_FETCHES_PER_CLIENT)
+
+
+class Busy(Exception):
+    """A fetch was refused because the client or the lab is at its limit."""
+
+
+class _NoCookies(DefaultCookiePolicy):
+    def set_ok(self, cookie, request):
+        return False
+
+
+def _fetching_threads():
+    return int(os.environ.get('LAB_THREADS', 8)) + int(os.environ.get('SSRF_JOB_WORKERS', 32))
+
+
+def _shared_adapter():
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            from requests.adapters import HTTPAdapter
+
+            import connections
+
+            # pool_block caps connections per host, and requests waits for a free one
+            # with no timeout. Every thread that fetches (request threads and blind-job
+            # workers) holds at most one connection, so a pool that size never makes
+            # a fetch wait.
+            _adapter = connections.install(HTTPAdapter(
+                pool_connections=int(os.environ.get('SSRF_POOL_HOSTS', 32)),
+                pool_maxsize=int(os.environ.get('SSRF_POOL_PER_HOST', _fetching_threads())),
+                pool_block=True,
+                max_retries=0,
+            ))
+        return _adapter
+
+
+def session():
+    """This thread's session on the shared connection pool."""
+    s = getattr(_local, 'session', None)
+    if s is None:
+        import requests
+
+        adapter = _shared_adapter()
+        s = requests.Session()
+        s.mount('http://', adapter)
+        s.mount('https://', adapter)
+        s.cookies.set_policy(_NoCookies())
+        _local.session = s
+    return s
+
+
+def _decode(body, encoding):
+    """Decode like ``Response.text``, but only the bytes that were kept."""
+    if encoding is None:
+        from requests.compat import chardet
+
+        encoding = (chardet.detect(body)['encoding'] if chardet else None) or 'utf-8'
+    try:
+        return str(body, encoding, errors='replace')
+    except (LookupError, TypeError):
+        return str(body, errors='replace')
+
+
+def _chunks(response):
+    """Body chunks as soon as any bytes arrive, so the deadline is checked often.
+
+    ``iter_content`` blocks until a whole chunk is buffered, which lets a server
+    trickling one byte at a time run far past the deadline.
+    """
+    import requests
+    from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+
+    raw = response.raw
+    if not hasattr(raw, 'read1'):  # urllib3 < 2.3
+        yield from response.iter_content(CHUNK_SIZE)
+        return
+    # Same exception mapping as iter_content
+    try:
+        while True:
+            chunk = raw.read1(CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e)
+
+
+def _read_capped(response, deadline):
+    import requests
+
+    body = bytearray()
+    for chunk in _chunks(response):
+        body += chunk
+        if len(body) >= MAX_CONTENT_BYTES:
+            break
+        if time.monotonic() > deadline:
+            raise requests.exceptions.ReadTimeout(f'Fetch exceeded the {FETCH_DEADLINE:g}s deadline')
+    return bytes(body[:MAX_CONTENT_BYTES])
+
+
+def _fetch(url, headers=None):
+    deadline = time.monotonic() + FETCH_DEADLINE
+    response = session().get(url, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=True)
+    try:
+        return _read_capped(response, deadline), response.encoding
+    finally:
+        # Drops the connection instead of draining it if we stopped early
+        response.close()
+
+
+@contextmanager
+def _slot(slots, client):
+    refused = slots.acquire(client)
+    if refused == 'client':
+        raise Busy('Too many requests in progress from this client, try again shortly')
+    if refused == 'full':
+        raise Busy('Too many outbound requests in progress, try again shortly')
+    try:
+        yield
+    finally:
+        slots.release(client)
+
+
+def fetch_text(url, level, client=None, slots=FETCHES, owner=None):
+    """GET ``url`` for ``level`` and return at most MAX_CONTENT_CHARS of its body.
+
+    ``owner`` names the instance the fetch is made for, so the internal
+    service answers with that instance's files (see internal_service).
+    Raises ``Busy`` if ``slots`` are all taken, or ``client`` holds its share.
+    Duration, outcome and bytes read are recorded in the outbound metrics.
+    Levels with caching enabled may be answered from response_cache.
+    """
+    cached = response_cache.enabled(level)
+    if cached:
+        content = response_cache.CACHE.get(level, url, owner)
+        if content is not None:
+            return content
+
+    # Only sent to the internal service itself (connections.py)
+    headers = {internal_service.OWNER_HEADER: internal_service.owner_header(owner)} if owner is not None else None
+    started = time.perf_counter()
+    try:
+        with _slot(slots, client):
+            body, encoding = _fetch(url, headers)
+    except Busy:
+        metrics.OUTBOUND_DURATION.observe(time.perf_counter() - started, level, 'rejected')
+        raise
+    except Exception:
+        metrics.OUTBOUND_DURATION.observe(time.perf_counter() - started, level, 'error')
+        raise
+
+    metrics.OUTBOUND_DURATION.observe(time.perf_counter() - started, level, 'ok')
+    metrics.OUTBOUND_BYTES.inc(level, amount=len(body))
+    content = _decode(body, encoding)[:MAX_CONTENT_CHARS]
+    if cached:
+        response_cache.CACHE.put(level, url, content, owner)
+    return content
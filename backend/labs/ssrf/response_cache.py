@@ -0,0 +1,107 @@
+"""Short-lived cache of SSRF fetch results, per level.
+
+Students fetch the same few URLs over and over; with caching enabled for a
+level, a repeat fetch within SSRF_CACHE_TTL seconds is answered from memory
+instead of going back out. Only successful fetches are stored. Each level
+and each instance owner has its own namespace (internal files carry the
+owner's flags), and the lookup happens inside ``outbound.fetch_text``, i.e.
+after the level's own URL checks have run.
+
+Caching is opt-in per level because it changes observable behaviour (a
+cached hit is fast and does not reach the target, which matters for blind
+and timing-based levels):
+
+    SSRF_CACHE_LEVELS      comma-separated levels, e.g. easy,medium (default: none)
+    SSRF_CACHE_TTL         seconds an entry stays fresh           (default: 30)
+    SSRF_CACHE_MAX_BYTES   memory budget for cached content       (default: 8 MiB)
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+from labkit import metrics
+
+LEVELS = frozenset(filter(None, (level.strip() for level in os.environ.get('SSRF_CACHE_LEVELS', '').split(','))))
+TTL = float(os.environ.get('SSRF_CACHE_TTL', 30))
+MAX_BYTES = int(os.environ.get('SSRF_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+LOOKUPS = metrics.REGISTRY.counter(
+    'lab_ssrf_cache_lookups_total', 'SSRF response cache lookups by level and result.', ('level', 'result'))
+
+
+def normalize(url):
+    """Cache key for ``url``: lower-case scheme and host, no default port or fragment.
+
+    Only rewrites that cannot change what is fetched, so e.g. ``127.1`` and
+    ``127.0.0.1`` stay distinct entries.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    host = parts.hostname or ''
+    if ':' in host:
+        host = f'[{host}]'
+    if port is not None and port != _DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f'{host}:{port}'
+    if parts.username is not None or parts.password is not None:
+        host = parts.netloc.rpartition('@')[0] + '@' + host
+    return urlunsplit((parts.scheme.lower(), host, parts.path or '/', parts.query, ''))
+
+
+class ResponseCache:
+    def __init__(self, ttl=TTL, max_bytes=MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # (level, owner, key) -> (expires, content, size)
+        self._lock = threading.Lock()
+
+    def get(self, level, url, owner=None):
+        key = (level, owner, normalize(url))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        LOOKUPS.inc(level, 'hit' if entry is not None else 'miss')
+        return entry[1] if entry is not None else None
+
+    def put(self, level, url, content, owner=None):
+        size = sys.getsizeof(content)
+        if size > self.max_bytes:
+            return
+        key = (level, owner, normalize(url))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, content, size)
+            self.size += size
+            # Least recently used first; expired entries go the same way
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        # Called with the lock held
+        self.size -= self._entries.pop(key)[2]
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.size}
+
+
+CACHE = ResponseCache()
+metrics.REGISTRY.gauge('lab_ssrf_cache', 'SSRF response cache entries and bytes held.',
+                       lambda: [({'measure': k}, v) for k, v in CACHE.stats().items()])
+
+
+def enabled(level):
+    return level in LEVELS
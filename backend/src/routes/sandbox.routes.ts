@@ -6,6 +6,9 @@ import sandboxService from '../services/sandbox.service';
 
 const router = Router();
 
+// Sandboxes that hold a container: 'starting' ones did not answer /readyz in time
+const ACTIVE_STATUSES = ['starting', 'running'];
+
 // Check usage limit middleware
 async function checkUsageLimit(req: AuthRequest, res: Response, next: any) {
   try {
@@ -79,10 +82,10 @@ router.post(
       const userId = req.user?.userId;
       const { labType, difficultyLevel } = req.body;
 
-      // Check if user already has a running sandbox for this lab
+      // Check if user already has a running (or still starting) sandbox for this lab
       const existingSandbox = await client.query(
-        'SELECT id, container_id FROM sandbox_instances WHERE user_id = $1 AND lab_type = $2 AND status = $3',
-        [userId, labType, 'running']
+        'SELECT id, container_id FROM sandbox_instances WHERE user_id = $1 AND lab_type = $2 AND status = ANY($3)',
+        [userId, labType, ACTIVE_STATUSES]
       );
 
       if (existingSandbox.rows.length > 0) {
@@ -110,7 +113,8 @@ router.post(
 
       const lab = labConfig.rows[0];
 
-      // Create sandbox
+      // Create sandbox; labkit labs are waited on until /readyz answers (up to
+      // LAB_READY_TIMEOUT_MS), so this request can stay open that long
       const sandbox = await sandboxService.createSandbox({
         userId: userId!,
         labType,
@@ -127,7 +131,7 @@ router.post(
          (user_id, container_id, lab_type, difficulty_level, port, status, auto_stop_time)
          VALUES ($1, $2, $3, $4, $5, $6, $7)
          RETURNING *`,
-        [userId, sandbox.containerId, labType, difficultyLevel, sandbox.port, 'running', autoStopTime]
+        [userId, sandbox.containerId, labType, difficultyLevel, sandbox.port, sandbox.status, autoStopTime]
       );
 
       // Initialize user progress if not exists
@@ -159,7 +163,7 @@ router.post(
           port: sandbox.port,
           url: `http://localhost:${sandbox.port}`,
           autoStopTime,
-          status: 'running',
+          status: sandbox.status,
         },
       });
     } catch (error) {
@@ -271,9 +275,9 @@ router.get('/active', authenticateToken, async (req: AuthRequest, res: Response)
          lc.description
        FROM sandbox_instances si
        LEFT JOIN lab_configurations lc ON si.lab_type = lc.lab_type
-       WHERE si.user_id = $1 AND si.status = $2
+       WHERE si.user_id = $1 AND si.status = ANY($2)
        ORDER BY si.start_time DESC`,
-      [userId, 'running']
+      [userId, ACTIVE_STATUSES]
     );
 
     res.json({
@@ -317,9 +321,14 @@ router.get('/:sandboxId', authenticateToken, async (req: AuthRequest, res: Respo
     const sandbox = result.rows[0];
 
     // Get container status
-    if (sandbox.status === 'running') {
-      const status = await sandboxService.getSandboxStatus(sandbox.container_id);
-      if (status !== 'running') {
+    if (ACTIVE_STATUSES.includes(sandbox.status)) {
+      let status = await sandboxService.getSandboxStatus(sandbox.container_id);
+      // A lab saved as 'starting' stays so until its readiness probe answers
+      if (status === 'running' && sandbox.status === 'starting'
+          && !(await sandboxService.isReady(sandbox.lab_type, sandbox.port))) {
+        status = 'starting';
+      }
+      if (status !== sandbox.status) {
         await querySecure(
           'UPDATE sandbox_instances SET status = $1 WHERE id = $2',
           [status, sandboxId]
@@ -348,8 +357,8 @@ router.post('/restart/:sandboxId', authenticateToken, async (req: AuthRequest, r
     const { sandboxId } = req.params;
 
     const result = await querySecure(
-      'SELECT container_id FROM sandbox_instances WHERE id = $1 AND user_id = $2 AND status = $3',
-      [sandboxId, userId, 'running']
+      'SELECT container_id FROM sandbox_instances WHERE id = $1 AND user_id = $2 AND status = ANY($3)',
+      [sandboxId, userId, ACTIVE_STATUSES]
     );
 
     if (result.rows.length === 0) {
@@ -410,7 +419,7 @@ router.post(
       const correctFlag = sandbox.flags[sandbox.difficulty_level];
       const points = sandbox.points_per_level[sandbox.difficulty_level];
 
-      if (flag === correctFlag) {
+      if (sandboxService.flagMatches(sandbox.lab_type, userId!, correctFlag, flag)) {
         // Update user progress
         await client.query(
           `UPDATE user_progress
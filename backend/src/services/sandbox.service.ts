@@ -1,4 +1,6 @@
+import crypto from 'crypto';
 import Docker from 'dockerode';
+import http from 'http';
 import { v4 as uuidv4 } from 'uuid';
 
 interface SandboxConfig {
@@ -46,6 +48,72 @@ class SandboxService {
     this.usedPorts.delete(port);
   }
 
+  // Serving mode overrides for the Python labs (see labs/labkit/serving.py).
+  // Unset variables keep the image defaults (gunicorn, 1 worker, 8 threads).
+  private labServerEnv(): string[] {
+    return ['LAB_SERVER', 'LAB_WORKERS', 'LAB_THREADS', 'LAB_GRACEFUL_TIMEOUT']
+      .filter((name) => process.env[name])
+      .map((name) => `${name}=${process.env[name]}`);
+  }
+
+  // Python labs built on labs/labkit: per-user flags when LAB_FLAG_SECRET is set
+  // (labkit/flags.py) and a /readyz probe (labkit/health.py)
+  private readonly labkitLabs = new Set(['ssrf', 'crypto_failures']);
+  // How long /start waits for /readyz; a lab still starting after that is saved
+  // as 'starting' and promoted by isReady() when its details are fetched
+  private readonly readyTimeoutMs = parseInt(process.env.LAB_READY_TIMEOUT_MS || '30000', 10);
+
+  private flagSecret(labType: string): string | undefined {
+    return this.labkitLabs.has(labType) ? process.env.LAB_FLAG_SECRET || undefined : undefined;
+  }
+
+  // The flag a user's instance serves: FLAG{base_<12 hex of HMAC-SHA256(secret, "<user>:<base>")>}
+  expectedFlag(labType: string, userId: string, baseFlag: string): string {
+    const secret = this.flagSecret(labType);
+    if (!secret || !baseFlag) {
+      return baseFlag;
+    }
+    const tag = crypto.createHmac('sha256', secret).update(`${userId}:${baseFlag}`).digest('hex').slice(0, 12);
+    return `${baseFlag.slice(0, -1)}_${tag}}`;
+  }
+
+  // Constant-time comparison of a submitted flag with the user's expected flag
+  flagMatches(labType: string, userId: string, baseFlag: string, submitted: unknown): boolean {
+    if (typeof submitted !== 'string' || !baseFlag) {
+      return false;
+    }
+    const digest = (value: string) => crypto.createHash('sha256').update(value).digest();
+    return crypto.timingSafeEqual(digest(submitted), digest(this.expectedFlag(labType, userId, baseFlag)));
+  }
+
+  private probeReady(port: number): Promise<boolean> {
+    return new Promise((resolve) => {
+      const req = http.get({ host: '127.0.0.1', port, path: '/readyz', timeout: 1000 }, (res) => {
+        res.resume();
+        resolve(res.statusCode === 200);
+      });
+      req.on('timeout', () => req.destroy());
+      req.on('error', () => resolve(false));
+    });
+  }
+
+  // Whether a sandbox saved as 'starting' answers its readiness probe now
+  async isReady(labType: string, port: number): Promise<boolean> {
+    return !this.labkitLabs.has(labType) || this.probeReady(port);
+  }
+
+  // Poll /readyz until the lab has finished starting; milliseconds waited, or null on timeout
+  private async waitUntilReady(port: number): Promise<number | null> {
+    const started = Date.now();
+    while (Date.now() - started < this.readyTimeoutMs) {
+      if (await this.probeReady(port)) {
+        return Date.now() - started;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 50));
+    }
+    return null;
+  }
+
   // Create isolated sandbox container
   async createSandbox(config: SandboxConfig): Promise<SandboxInstance> {
     try {
@@ -57,7 +125,12 @@ class SandboxService {
         `LAB_TYPE=${config.labType}`,
         `DIFFICULTY=${config.difficultyLevel}`,
         `USER_ID=${config.userId}`,
+        ...this.labServerEnv(),
       ];
+      const flagSecret = this.flagSecret(config.labType);
+      if (flagSecret) {
+        env.push(`LAB_FLAG_SECRET=${flagSecret}`);
+      }
 
       // Create container with network isolation
       const container = await this.docker.createContainer({
@@ -89,14 +162,27 @@ class SandboxService {
       });
 
       // Start container
+      const created = Date.now();
       await container.start();
 
+      // Labs with a readiness probe are handed out only once they answer
+      let status: SandboxInstance['status'] = 'running';
+      if (this.labkitLabs.has(config.labType)) {
+        const waited = await this.waitUntilReady(port);
+        if (waited === null) {
+          status = 'starting';
+          console.warn(`⚠️ Sandbox ${containerName} not ready after ${this.readyTimeoutMs} ms`);
+        } else {
+          console.log(`⏱️ Sandbox ${containerName} ready ${Date.now() - created} ms after start`);
+        }
+      }
+
       console.log(`✅ Sandbox created: ${containerName} on port ${port}`);
 
       return {
         containerId: container.id,
         port,
-        status: 'running',
+        status,
       };
     } catch (error) {
       console.error('Failed to create sandbox:', error);